@@ -0,0 +1,102 @@
+"""
+Run slow work off the Tk thread.
+
+Jobs run on worker threads. Their progress reports and results are queued
+and handed to callbacks on the Tk thread by a root.after poll, so the
+callbacks may touch widgets freely. Each job belongs to a channel; starting
+a new job on a channel, or cancelling it, makes the old job's pending
+callbacks disappear.
+
+    tasks = BackgroundTasks(root)
+    tasks.submit("moves", board.filter_legal_moves_for_check, square,
+                 on_done=show_moves)
+"""
+
+import queue
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 16  # About 60 polls a second, one per frame
+
+
+class BackgroundTasks:
+    def __init__(self, root, workers=2, poll_ms=POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # (channel, generation, callback, value, whether value is the finished future)
+        self._results = queue.Queue()
+        self._generations = {}
+        self._cancellers = {}  # Channels with a job running -> its on_cancel
+        self._closed = False
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(
+        self, channel, job, *args, on_done=None, on_progress=None, on_cancel=None
+    ):
+        """
+        Run job(*args) on a worker thread, first cancelling whatever runs on
+        channel. With on_progress, the job is also passed a report function
+        whose values reach on_progress. on_done gets the job's return value;
+        on_cancel is called (on the Tk thread) if the job is cancelled, and
+        should make the job return soon, e.g. by stopping a search.
+        """
+        self.cancel(channel)
+        generation = self._generations.get(channel, 0) + 1
+        self._generations[channel] = generation
+        self._cancellers[channel] = on_cancel
+
+        def report(value):
+            self._results.put((channel, generation, on_progress, value, False))
+
+        def run():
+            if on_progress is not None:
+                return job(*args, report)
+            return job(*args)
+
+        future = self._executor.submit(run)
+        future.add_done_callback(
+            lambda done: self._results.put((channel, generation, on_done, done, True))
+        )
+        return future
+
+    def busy(self, channel):
+        return channel in self._cancellers
+
+    def cancel(self, channel):
+        """Drop the pending callbacks of channel's job and ask it to stop"""
+        if channel not in self._cancellers:
+            return
+        on_cancel = self._cancellers.pop(channel)
+        self._generations[channel] += 1
+        if on_cancel is not None:
+            on_cancel()
+
+    def close(self):
+        for channel in list(self._cancellers):
+            self.cancel(channel)
+        self._closed = True
+        self._executor.shutdown(wait=False)
+
+    def _poll(self):
+        """Deliver queued results on the Tk thread, then poll again"""
+        while True:
+            try:
+                channel, generation, callback, value, finished = (
+                    self._results.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if generation != self._generations.get(channel):
+                continue  # From a job that has since been cancelled or replaced
+            if finished:
+                self._cancellers.pop(channel, None)
+                try:
+                    value = value.result()
+                except Exception:
+                    traceback.print_exc()
+                    continue
+            if callback is not None:
+                callback(value)
+        if not self._closed:
+            self.root.after(self.poll_ms, self._poll)
@@ -0,0 +1,283 @@
+"""
+Bitboard backend for BoardState.
+
+Squares are numbered 0-63 in the same order as BoardState.board, so square
+``row * 8 + col`` is ``board[row][col]`` and the bit ``1 << square`` marks it.
+Row 0 is black's back rank, row 7 is white's.
+
+Each color's attack map (every square it attacks) is not updated move by
+move. A slider's attacks change whenever any piece on its lines moves, so
+an exact incremental update costs about as much as recomputing. Instead
+add() and remove() drop both maps, attacks() rebuilds a map from scratch
+the first time it is asked for (3-10us, depending on how many sliders are
+on the board), and unmake_move puts back the maps saved before the move.
+is_attacked() answers single squares without a map, so most positions
+never need one.
+"""
+
+from pieces.pieces import (
+    KNIGHT_TARGETS,
+    KING_TARGETS,
+    PAWN_CAPTURES,
+    RAYS as SQUARE_RAYS,
+)
+from pieces.pieces import BISHOP_DIRECTIONS, QUEEN_DIRECTIONS, ROOK_DIRECTIONS
+from evaluation import SQUARE_SCORES
+from zobrist import PIECE_KEYS
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+ROW_0 = 0xFF
+ROW_7 = ROW_0 << 56
+LIGHT_SQUARES = 0xAA55AA55AA55AA55  # a8 (square 0) is light
+
+###############
+# SQUARES
+###############
+
+
+def square_index(position):
+    return position[0] * 8 + position[1]
+
+
+def square_position(square):
+    return divmod(square, 8)
+
+
+def lsb(bb):
+    """Index of the lowest set bit"""
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):
+    """Index of the highest set bit"""
+    return bb.bit_length() - 1
+
+
+def iter_squares(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+###############
+# ATTACK TABLES
+###############
+
+# The masks are built from the square lists in pieces.pieces so both agree
+
+
+def _mask(positions):
+    mask = 0
+    for row, col in positions:
+        mask |= 1 << (row * 8 + col)
+    return mask
+
+
+KNIGHT_ATTACKS = [_mask(targets) for targets in KNIGHT_TARGETS]
+KING_ATTACKS = [_mask(targets) for targets in KING_TARGETS]
+# White pawns move towards row 0, black pawns towards row 7
+PAWN_ATTACKS = (
+    [_mask(targets) for targets in PAWN_CAPTURES["w"]],
+    [_mask(targets) for targets in PAWN_CAPTURES["b"]],
+)
+
+# Each slider direction is (rays, forward); forward rays walk towards higher
+# square indices, so their nearest blocker is the lowest set bit.
+RAYS = {
+    direction: [_mask(SQUARE_RAYS[square][direction]) for square in range(64)]
+    for direction in QUEEN_DIRECTIONS
+}
+_ROOK_RAYS = tuple(
+    (RAYS[direction], direction[0] * 8 + direction[1] > 0)
+    for direction in ROOK_DIRECTIONS
+)
+_BISHOP_RAYS = tuple(
+    (RAYS[direction], direction[0] * 8 + direction[1] > 0)
+    for direction in BISHOP_DIRECTIONS
+)
+
+
+def _between_masks():
+    """BETWEEN[a][b]: squares strictly between two squares on a shared line"""
+    between = [[0] * 64 for _ in range(64)]
+    for start in range(64):
+        for ray in SQUARE_RAYS[start].values():
+            for distance, (row, col) in enumerate(ray):
+                between[start][row * 8 + col] = _mask(ray[:distance])
+    return between
+
+
+BETWEEN = _between_masks()
+
+
+def _slide(square, occupied, rays):
+    attacks = 0
+    for ray_table, forward in rays:
+        ray = ray_table[square]
+        blockers = ray & occupied
+        if blockers:
+            if forward:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= ray_table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    return _slide(square, occupied, _ROOK_RAYS)
+
+
+def bishop_attacks(square, occupied):
+    return _slide(square, occupied, _BISHOP_RAYS)
+
+
+def queen_attacks(square, occupied):
+    return _slide(square, occupied, _ROOK_RAYS) | _slide(square, occupied, _BISHOP_RAYS)
+
+
+###############
+# BITBOARDS
+###############
+
+
+def pawn_attacks(pawns, color):
+    """Squares attacked by all pawns of color at once"""
+    if color == WHITE:
+        return ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+    return (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL
+
+
+class Bitboards:
+    """Piece placement as one bitboard per color and piece type"""
+
+    def __init__(self):
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        self.occupied = 0
+        # What stands on each square: 0 when empty, else 1 + 6 * color + piece_type
+        self.mailbox = bytearray(64)
+        # Zobrist key of the placement alone, updated with every add and remove
+        self.key = 0
+        # Material and piece-square score for white, kept up to date the same way
+        self.score = 0
+        # Squares attacked by each color, computed on demand and dropped
+        # whenever the placement changes (see attacks)
+        self.attack_maps = [None, None]
+
+    def add(self, square, color, piece_type):
+        mask = 1 << square
+        self.pieces[color][piece_type] |= mask
+        self.occupancy[color] |= mask
+        self.occupied |= mask
+        self.key ^= PIECE_KEYS[color][piece_type][square]
+        self.score += SQUARE_SCORES[color][piece_type][square]
+        self.mailbox[square] = 1 + 6 * color + piece_type
+        self.attack_maps[WHITE] = self.attack_maps[BLACK] = None
+
+    def remove(self, square, color, piece_type):
+        mask = ~(1 << square)
+        self.pieces[color][piece_type] &= mask
+        self.occupancy[color] &= mask
+        self.occupied &= mask
+        self.key ^= PIECE_KEYS[color][piece_type][square]
+        self.score -= SQUARE_SCORES[color][piece_type][square]
+        self.mailbox[square] = 0
+        self.attack_maps[WHITE] = self.attack_maps[BLACK] = None
+
+    def rebuild(self):
+        """Recompute occupancy after pieces, mailbox, key and score were set directly"""
+        pieces = self.pieces
+        self.occupancy = [
+            pieces[color][PAWN]
+            | pieces[color][KNIGHT]
+            | pieces[color][BISHOP]
+            | pieces[color][ROOK]
+            | pieces[color][QUEEN]
+            | pieces[color][KING]
+            for color in (WHITE, BLACK)
+        ]
+        self.occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        self.attack_maps = [None, None]
+
+    def attacks(self, color):
+        """
+        Every square attacked by color. Sliders see through the enemy king, so
+        the squares behind it on a checking line count as attacked too.
+        """
+        attack_map = self.attack_maps[color]
+        if attack_map is None:
+            attack_map = self._compute_attacks(color)
+            self.attack_maps[color] = attack_map
+        return attack_map
+
+    def _compute_attacks(self, color):
+        pieces = self.pieces[color]
+        occupied = self.occupied & ~self.pieces[1 - color][KING]
+        attacks = pawn_attacks(pieces[PAWN], color)
+        for square in iter_squares(pieces[KNIGHT]):
+            attacks |= KNIGHT_ATTACKS[square]
+        for square in iter_squares(pieces[KING]):
+            attacks |= KING_ATTACKS[square]
+        for square in iter_squares(pieces[ROOK] | pieces[QUEEN]):
+            attacks |= _slide(square, occupied, _ROOK_RAYS)
+        for square in iter_squares(pieces[BISHOP] | pieces[QUEEN]):
+            attacks |= _slide(square, occupied, _BISHOP_RAYS)
+        return attacks
+
+    def piece_type_at(self, square, color):
+        """Type of color's piece on square, or None"""
+        piece_type = self.mailbox[square] - 1 - 6 * color
+        return piece_type if 0 <= piece_type < 6 else None
+
+    def king_square(self, color):
+        kings = self.pieces[color][KING]
+        return lsb(kings) if kings else None
+
+    def attackers_of(self, square, color, occupied=None):
+        """Bitboard of the pieces of color that attack square"""
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces[color]
+        attackers = (
+            (PAWN_ATTACKS[1 - color][square] & pieces[PAWN])
+            | (KNIGHT_ATTACKS[square] & pieces[KNIGHT])
+            | (KING_ATTACKS[square] & pieces[KING])
+        )
+        rooks = pieces[ROOK] | pieces[QUEEN]
+        if rooks:
+            attackers |= rook_attacks(square, occupied) & rooks
+        bishops = pieces[BISHOP] | pieces[QUEEN]
+        if bishops:
+            attackers |= bishop_attacks(square, occupied) & bishops
+        return attackers
+
+    def is_attacked(self, square, color):
+        """
+        Whether color attacks square, seeing through the enemy king like
+        attacks(). Reads the attack map when it is already computed, otherwise
+        tries the attacker types one at a time and stops at the first hit.
+        """
+        attack_map = self.attack_maps[color]
+        if attack_map is not None:
+            return attack_map >> square & 1 == 1
+        pieces = self.pieces[color]
+        if (
+            PAWN_ATTACKS[1 - color][square] & pieces[PAWN]
+            or KNIGHT_ATTACKS[square] & pieces[KNIGHT]
+            or KING_ATTACKS[square] & pieces[KING]
+        ):
+            return True
+        occupied = self.occupied & ~self.pieces[1 - color][KING]
+        rooks = pieces[ROOK] | pieces[QUEEN]
+        if rooks and rook_attacks(square, occupied) & rooks:
+            return True
+        bishops = pieces[BISHOP] | pieces[QUEEN]
+        return bool(bishops and bishop_attacks(square, occupied) & bishops)
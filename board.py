@@ -1,20 +1,202 @@
-from pieces.pieces import Piece, Pawn, Rook, Knight, Bishop, King, Queen
-from copy import copy
+import collections
+import struct
+from typing import NamedTuple
+
+from pieces.pieces import Pawn, Rook, Knight, Bishop, King, Queen
+from bitboard import Bitboards, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from bitboard import (
+    BETWEEN,
+    FULL,
+    KING_ATTACKS,
+    KNIGHT_ATTACKS,
+    LIGHT_SQUARES,
+    PAWN_ATTACKS,
+    ROW_0,
+    ROW_7,
+)
+from bitboard import bishop_attacks, rook_attacks, queen_attacks
+from bitboard import iter_squares, lsb, square_index, square_position
+from moves import encode_move, move_start, move_end, move_promotion
+from moves import parse_square, square_name
+from evaluation import SQUARE_SCORES
+from zobrist import BLACK_TO_MOVE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, PIECE_KEYS
+
+COLORS = {"w": WHITE, "b": BLACK}
+COLOR_NAMES = ("w", "b")
+PIECE_CLASSES = (Pawn, Knight, Bishop, Rook, Queen, King)
+# The shared piece instances, indexed by Bitboards.mailbox codes (0 is empty)
+MAILBOX_PIECES = (None,) + tuple(
+    piece_class(color) for color in COLOR_NAMES for piece_class in PIECE_CLASSES
+)
+
+# to_bytes layout: 12 bitboards (white pawns .. black king), side to move,
+# castling rights, en passant square (255 for none), halfmove clock and
+# fullmove number
+PACKED_POSITION = struct.Struct("<12Q3B2H")
+
+# Castling rights are a 4-bit mask indexed as CASTLING_RIGHTS[color][kingside]
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_RIGHTS = (
+    {True: WHITE_KINGSIDE, False: WHITE_QUEENSIDE},
+    {True: BLACK_KINGSIDE, False: BLACK_QUEENSIDE},
+)
+# Squares the king crosses and squares that must be empty, keyed like CASTLING_RIGHTS
+CASTLING_PATHS = (
+    {True: (60, 62, 0x60 << 56), False: (60, 58, 0x0E << 56)},
+    {True: (4, 6, 0x60), False: (4, 2, 0x0E)},
+)
+PROMOTION_TYPES = (QUEEN, ROOK, BISHOP, KNIGHT)
+# Rights that survive a move touching each square (king or rook home squares)
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[63] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[56] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[7] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[0] = 15 & ~BLACK_QUEENSIDE
+
+MOVE_CACHE_SIZE = 1024  # Positions whose legal moves each board remembers
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# FEN letters indexed as FEN_PIECES[color][piece_type]
+FEN_PIECES = ("PNBRQK", "pnbrqk")
+FEN_SYMBOLS = {
+    symbol: (color, piece_type)
+    for color, symbols in enumerate(FEN_PIECES)
+    for piece_type, symbol in enumerate(symbols)
+}
+FEN_CASTLING = {
+    "K": WHITE_KINGSIDE,
+    "Q": WHITE_QUEENSIDE,
+    "k": BLACK_KINGSIDE,
+    "q": BLACK_QUEENSIDE,
+}
+
+
+class BoardRow:
+    """
+    A row of BoardState.board, read from and written through to the
+    bitboards' mailbox so the two never disagree
+    """
+
+    __slots__ = ("_offset", "_bitboards")
+
+    def __init__(self, row, bitboards):
+        self._offset = row * 8
+        self._bitboards = bitboards
+
+    def __getitem__(self, col):
+        return MAILBOX_PIECES[self._bitboards.mailbox[self._offset + col]]
+
+    def __setitem__(self, col, piece):
+        square = self._offset + col
+        old_code = self._bitboards.mailbox[square]
+        if old_code:
+            self._bitboards.remove(square, *divmod(old_code - 1, 6))
+        if piece is not None:
+            self._bitboards.add(square, COLORS[piece.color], piece.piece_type)
+
+    def __iter__(self):
+        mailbox = self._bitboards.mailbox
+        return (
+            MAILBOX_PIECES[code] for code in mailbox[self._offset : self._offset + 8]
+        )
+
+    def __len__(self):
+        return 8
+
+
+# Outcome terminations
+CHECKMATE = "checkmate"
+STALEMATE = "stalemate"
+INSUFFICIENT_MATERIAL = "insufficient material"
+FIFTY_MOVES = "fifty-move rule"
+THREEFOLD_REPETITION = "threefold repetition"
+
+
+class Outcome(NamedTuple):
+    termination: str
+    winner: str  # "w" or "b", None for a draw
+
+    @property
+    def result(self):
+        """The PGN result: 1-0, 0-1 or 1/2-1/2"""
+        if self.winner is None:
+            return "1/2-1/2"
+        return "1-0" if self.winner == "w" else "0-1"
+
+
+class MoveCache:
+    """
+    Legal move lists keyed by Zobrist key, dropping the least recently used
+    position once capacity is reached. The key covers placement, side to
+    move, castling rights and any capturable en passant square, so a cached
+    list is never stale: any change to the position changes the key.
+    """
+
+    def __init__(self, capacity=MOVE_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Whether key is cached, without counting a hit or miss"""
+        return key in self._entries
+
+    def get(self, key):
+        moves = self._entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return moves
+
+    def put(self, key, moves):
+        if self.capacity <= 0:
+            return
+        self._entries[key] = moves
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
 
 
 class BoardState:
-    def __init__(self):
-        self.board = [[None for _ in range(8)] for _ in range(8)]
-        self.setup_pieces()
+    def __init__(self, empty=False, move_cache_size=MOVE_CACHE_SIZE):
+        self.bitboards = Bitboards()
+        self.board = [BoardRow(row, self.bitboards) for row in range(8)]
+        if not empty:
+            self.setup_pieces()
         self.white_to_move = True
-        # TODO: will want to store chess notation to eventually download game files
+        # Encoded moves played since the position was set up (see pgn.py for SAN)
         self.move_log = []
         # Game state related
-        self.last_to_move = None
+        self.castling_rights = 15
+        self.ep_square = None  # Square a pawn skipped over on the last move
+        self.halfmove_clock = 0  # Plies since the last capture or pawn move
+        self.fullmove_number = 1
         self.en_passant_squares = []
-        self.check_white = False
-        self.check_black = False
-        self.castled_rook_position = None
+        # One record per made move, popped by unmake_move
+        self._undo_stack = []
+        self.move_cache = MoveCache(move_cache_size)
+        # How often each position has occurred, by Zobrist key. Counting
+        # starts with the first move, from the position before it, and
+        # _position_keys lists the counted keys in order for unmake_move.
+        self.position_counts = {}
+        self._position_keys = []
 
     ###############
     # SETUP
@@ -25,11 +207,11 @@ class BoardState:
             [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
         ):
             # black pieces
-            self.board[0][col] = piece_class("b", (0, col))  # Back rank
-            self.board[1][col] = Pawn("b", (1, col))
+            self.board[0][col] = piece_class("b")  # Back rank
+            self.board[1][col] = Pawn("b")
             # white pieces
-            self.board[6][col] = Pawn("w", (6, col))
-            self.board[7][col] = piece_class("w", (7, col))
+            self.board[6][col] = Pawn("w")
+            self.board[7][col] = piece_class("w")
 
     def _get_color(self, opponent=False):
         if opponent:
@@ -49,295 +231,661 @@ class BoardState:
     # PAWN MOVING
     ###############
 
-    def _is_en_passant_allowed(self, piece):
-        """Check both pieces are pawns and the previous move was the pawn's first"""
+    def _is_en_passant_allowed(self, piece, position):
+        """Check the piece is a pawn to move that attacks the skipped-over square"""
         return (
             isinstance(piece, Pawn)
-            and isinstance(self.last_to_move, Pawn)
-            and self.last_to_move.first_move
+            and self.ep_square is not None
+            and piece.color == self._get_color()
+            and PAWN_ATTACKS[COLORS[piece.color]][square_index(position)]
+            >> self.ep_square
+            & 1
         )
 
-    def _get_en_passant_move(self, piece):
-        if self._is_en_passant_allowed(piece):
-            # Get position of current pawn and opponent pawn moved on last turn
-            opp_row, opp_col = self.last_to_move.position
-            piece_row, piece_col = piece.position
-            direction = -1 if piece.color == "w" else 1
-
-            if piece_row == opp_row and abs(piece_col - opp_col) == 1:
-                potential_move = (piece_row + direction, opp_col)
+    def _get_en_passant_move(self, piece, position):
+        if self._is_en_passant_allowed(piece, position):
+            potential_move = square_position(self.ep_square)
+            if potential_move not in self.en_passant_squares:
                 self.en_passant_squares.append(potential_move)
-                return potential_move
-
-    def _is_legal_pawn_move(self, piece, move):
-        move_square = self.board[move[0]][move[1]]
-        forward_move = piece.position[1] == move[1] and move_square is None
-        diagonal_capture = (
-            piece.position[1] != move[1]
-            and move_square is not None
-            and move_square.color != piece.color
-        )
-        return forward_move or diagonal_capture
-
-    def _promote_pawn_to_queen(self, position):
-        self.board[position[0]][position[1]] = Queen(self._get_color(), position)
+            return potential_move
 
-    def _promote_pawn_if_eligible(self, piece, end):
+    def _get_promotion(self, piece, end):
+        """Pawns reaching the back rank are promoted to queens"""
         end_row = self._get_back_rank(opponent=True)
         if isinstance(piece, Pawn) and end[0] == end_row:
-            self._promote_pawn_to_queen(end)
+            return QUEEN
+        return 0
 
     ###############
     # CASTLING
     ###############
 
-    ### Castle eligibility ###
+    def _move_rook_for_castling(self, row, kingside, undo=False):
+        rook_start, rook_end = (7, 5) if kingside else (0, 3)
+        if undo:
+            rook_start, rook_end = rook_end, rook_start
+        rook = self.board[row][rook_start]
+        self.board[row][rook_start] = None
+        self.board[row][rook_end] = rook
+
+    ###############
+    # CHECK
+    ###############
+
+    def _get_king_position(self, opponent_king=True):
+        king_square = self.bitboards.king_square(COLORS[self._get_color(opponent_king)])
+        return None if king_square is None else square_position(king_square)
+
+    def _is_king_attacked(self, color):
+        kings = self.bitboards.pieces[color][KING]
+        return self.bitboards.attacks(1 - color) & kings != 0
+
+    @property
+    def check_white(self):
+        return self._is_king_attacked(WHITE)
+
+    @property
+    def check_black(self):
+        return self._is_king_attacked(BLACK)
+
+    def _search_for_check(self, opponent_king=True):
+        """Check if the specified king is in check."""
+        return self._is_king_attacked(COLORS[self._get_color(opponent_king)])
+
+    def in_check(self):
+        """Whether the side to move is in check"""
+        return self._is_king_attacked(WHITE if self.white_to_move else BLACK)
 
     def _is_square_under_attack(self, position):
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece is not None and piece.color == self._get_color(opponent=True):
-                    moves = self.filter_legal_moves_for_check(piece)
-                    if position in moves:
-                        return True
-        return False
-
-    def _is_castle_through_check(self, start, end):
-        direction = 1 if end[1] > start[1] else -1
-        for col in range(start[1], end[1] + direction, direction):
-            if self._is_square_under_attack((start[0], col)):
-                return True
-        return False
-
-    def _castle_path_is_clear(self, rook, king):
-        return self._is_path_clear(
-            king.position, rook.position
-        ) and not self._is_castle_through_check(king.position, rook.position)
-
-    def _king_and_queen_can_castle(self, rook, king):
-        """Check that the king and rook have not moved"""
-        return isinstance(rook, Rook) and rook.first_move and king.first_move
-
-    def _check_castle_eligibility(self, rook, king):
-        return self._king_and_queen_can_castle(
-            rook, king
-        ) and self._castle_path_is_clear(rook, king)
-
-    def _is_castle_legal(self, king):
-        in_check = self.check_white if self.white_to_move else self.check_white
-        if in_check:
-            return False
-        row = self._get_back_rank()
-        kingside_rook = self.board[row][7]
-        queenside_rook = self.board[row][0]
-        kingside_castle = self._check_castle_eligibility(kingside_rook, king)
-        queenside_castle = self._check_castle_eligibility(queenside_rook, king)
-        return kingside_castle or queenside_castle
-
-    ### Move pieces for castling ###
-
-    def _get_rook_positions_for_castling(self, kingside):
-        row = self._get_back_rank()
-        if kingside:
-            start, end = (row, 7), (row, 5)
+        return self.is_attacked(position)
+
+    def is_attacked(self, square: tuple, color: str = None):
+        """Whether color (default: the side not to move) attacks square"""
+        if color is None:
+            color = self._get_color(opponent=True)
+        return self.bitboards.is_attacked(square_index(square), COLORS[color])
+
+    def gives_check(self, move: int):
+        """
+        Whether a legal move for the side to move would check the opponent,
+        worked out from the bitboards without playing it. Covers direct and
+        discovered checks, promotions, en passant and the rook in castling.
+        """
+        color = WHITE if self.white_to_move else BLACK
+        bitboards = self.bitboards
+        start, end = move_start(move), move_end(move)
+        piece_type = bitboards.piece_type_at(start, color)
+        pieces = list(bitboards.pieces[color])
+        pieces[piece_type] ^= 1 << start
+        pieces[move_promotion(move) or piece_type] |= 1 << end
+        occupied = bitboards.occupied & ~(1 << start) | (1 << end)
+        if piece_type == PAWN and end == self.ep_square:
+            occupied &= ~(1 << (end + (8 if color == WHITE else -8)))
+        elif piece_type == KING and abs(end - start) == 2:
+            rook_start, rook_end = (
+                (end + 1, end - 1) if end > start else (end - 2, end + 1)
+            )
+            pieces[ROOK] ^= (1 << rook_start) | (1 << rook_end)
+            occupied ^= (1 << rook_start) | (1 << rook_end)
+        king_square = bitboards.king_square(1 - color)
+        return bool(
+            PAWN_ATTACKS[1 - color][king_square] & pieces[PAWN]
+            or KNIGHT_ATTACKS[king_square] & pieces[KNIGHT]
+            or rook_attacks(king_square, occupied) & (pieces[ROOK] | pieces[QUEEN])
+            or bishop_attacks(king_square, occupied) & (pieces[BISHOP] | pieces[QUEEN])
+        )
+
+    def attackers_of(self, square: tuple, color: str):
+        """Positions of the pieces of color attacking square"""
+        attackers = self.bitboards.attackers_of(square_index(square), COLORS[color])
+        return [square_position(attacker) for attacker in iter_squares(attackers)]
+
+    def filter_legal_moves_for_check(self, position: tuple):
+        """Squares the piece on position can legally move to"""
+        piece = self.board[position[0]][position[1]]
+        start = square_index(position)
+        if piece.color == self._get_color():
+            moves = [move for move in self.legal_moves() if move_start(move) == start]
         else:
-            start, end = (row, 0), (row, 3)  # Queenside rook's start and end positions
-        return start, end
-
-    def _get_king_destination_for_castling(self, kingside):
-        row = self._get_back_rank()
-        return (row, 6) if kingside else (row, 2)
-
-    def _move_pieces_for_castling(self, king, end):
-        if self._is_castle_legal(king):
-            kingside = end[1] == 6
-            queenside = end[1] == 2
-            if not (kingside or queenside):
-                return
-
-            rook_start, rook_end = self._get_rook_positions_for_castling(kingside)
-            rook = self.board[rook_start[0]][rook_start[1]]
-            king_end = self._get_king_destination_for_castling(kingside)
-
-            self.castled_rook_position = rook.position
-            self._simulate_move(king, king_end)
-            self._simulate_move(rook, rook_end)
-            self._finalize_move(rook)
-            self._finalize_move(king)
-            self._update_game_state_after_move()
+            moves = self.generate_legal_moves(COLORS[piece.color], 1 << start)
+        allowed_moves = []
+        for move in moves:
+            end = move_end(move)
+            if move_promotion(move) not in (0, QUEEN):
+                continue  # Board clicks only ever promote to a queen
+            if end == self.ep_square and isinstance(piece, Pawn):
+                self._get_en_passant_move(piece, position)
+            allowed_moves.append(square_position(end))
+        return allowed_moves
 
     ###############
-    # LEGAL MOVES
+    # LEGAL MOVE GENERATION
     ###############
 
-    ### Default tests for legal moves ###
-
-    def _is_path_clear(self, start, end):
-        """Check if all squares between a start and end square are empty"""
-        start_row, start_col = start
-        end_row, end_col = end
-        row_step = 1 if end_row > start_row else -1 if end_row < start_row else 0
-        col_step = 1 if end_col > start_col else -1 if end_col < start_col else 0
+    def _get_pins(self, color, king_square):
+        """Map each pinned piece of color to the squares it may still move to"""
+        bitboards = self.bitboards
+        enemy = bitboards.pieces[1 - color]
+        enemy_occupancy = bitboards.occupancy[1 - color]
+        snipers = (
+            rook_attacks(king_square, enemy_occupancy) & (enemy[ROOK] | enemy[QUEEN])
+        ) | (
+            bishop_attacks(king_square, enemy_occupancy)
+            & (enemy[BISHOP] | enemy[QUEEN])
+        )
+        pins = {}
+        for sniper in iter_squares(snipers):
+            between = BETWEEN[king_square][sniper]
+            blockers = between & bitboards.occupied
+            if blockers and not blockers & (blockers - 1):
+                if blockers & bitboards.occupancy[color]:
+                    pins[lsb(blockers)] = between | (1 << sniper)
+        return pins
+
+    def _is_en_passant_safe(self, color, king_square, start, end, captured_square):
+        """En passant removes two pawns from a rank at once, which can expose the king"""
+        bitboards = self.bitboards
+        enemy = bitboards.pieces[1 - color]
+        occupied = (bitboards.occupied ^ (1 << start) ^ (1 << captured_square)) | (
+            1 << end
+        )
+        return not (
+            rook_attacks(king_square, occupied) & (enemy[ROOK] | enemy[QUEEN])
+            or bishop_attacks(king_square, occupied) & (enemy[BISHOP] | enemy[QUEEN])
+        )
 
-        current_row, current_col = start_row + row_step, start_col + col_step
-        while (current_row, current_col) != end:
+    def _generate_castling_moves(self, color, king_square):
+        enemy_attacks = self.bitboards.attacks(1 - color)
+        for kingside in (True, False):
+            if not self.castling_rights & CASTLING_RIGHTS[color][kingside]:
+                continue
+            home, king_end, empty = CASTLING_PATHS[color][kingside]
+            rook_square = home + 3 if kingside else home - 4
+            crossed = (1 << home) | (1 << king_end) | BETWEEN[home][king_end]
             if (
-                not (0 <= current_row < 8 and 0 <= current_col < 8)
-                or self.board[current_row][current_col] is not None
+                king_square == home
+                and self.bitboards.pieces[color][ROOK] >> rook_square & 1
+                and not self.bitboards.occupied & empty
+                and not enemy_attacks & crossed
             ):
+                yield encode_move(home, king_end)
+
+    def _generate_pawn_moves(self, color, pawns, targets, pins, king_square, ep_square):
+        bitboards = self.bitboards
+        occupied = bitboards.occupied
+        enemy = bitboards.occupancy[1 - color]
+        forward = -8 if color == WHITE else 8
+        start_row = 6 if color == WHITE else 1
+        last_row = ROW_0 if color == WHITE else ROW_7
+        attack_table = PAWN_ATTACKS[color]
+        for start in iter_squares(pawns):
+            allowed = targets & pins.get(start, FULL)
+            ends = 0
+            one_step = start + forward
+            if not occupied >> one_step & 1:
+                ends |= 1 << one_step
+                two_step = one_step + forward
+                if start >> 3 == start_row and not occupied >> two_step & 1:
+                    ends |= 1 << two_step
+            ends |= attack_table[start] & enemy
+            for end in iter_squares(ends & allowed):
+                if last_row >> end & 1:
+                    for promotion in PROMOTION_TYPES:
+                        yield start | (end << 6) | (promotion << 12)
+                else:
+                    yield start | (end << 6)
+            if ep_square is not None and attack_table[start] >> ep_square & 1:
+                captured_square = ep_square - forward
+                # The capture can also answer a check given by the double-stepped pawn
+                if (
+                    (targets >> ep_square & 1 or targets >> captured_square & 1)
+                    and pins.get(start, FULL) >> ep_square & 1
+                    and self._is_en_passant_safe(
+                        color, king_square, start, ep_square, captured_square
+                    )
+                ):
+                    yield start | (ep_square << 6)
+
+    def legal_moves(self):
+        """
+        Every legal move for the side to move, as a tuple, answered from
+        move_cache when this position has been seen recently
+        """
+        key = self.zobrist_key
+        moves = self.move_cache.get(key)
+        if moves is None:
+            moves = tuple(self.generate_legal_moves())
+            self.move_cache.put(key, moves)
+        return moves
+
+    def generate_legal_moves(self, color=None, from_mask=FULL, to_mask=FULL):
+        """
+        All legal moves for color (default: side to move) as a list of
+        encoded moves; see iter_legal_moves for the masks.
+        """
+        return list(self.iter_legal_moves(color, from_mask, to_mask))
+
+    def iter_legal_moves(self, color=None, from_mask=FULL, to_mask=FULL):
+        """
+        Yield the legal moves for color (default: side to move) as encoded
+        moves, king moves first. Pins, checkers and the squares that answer
+        a check are worked out once, so every move is legal without playing
+        it and a caller that stops early does no further work. from_mask
+        limits the pieces that are moved and to_mask the squares they move
+        to; castling and en passant are only generated when to_mask is full.
+        """
+        if color is None:
+            color = WHITE if self.white_to_move else BLACK
+        bitboards = self.bitboards
+        pieces = bitboards.pieces[color]
+        own = bitboards.occupancy[color]
+        occupied = bitboards.occupied
+        king_square = lsb(pieces[KING])
+
+        if pieces[KING] & from_mask:
+            king_targets = (
+                KING_ATTACKS[king_square]
+                & ~own
+                & ~bitboards.attacks(1 - color)
+                & to_mask
+            )
+            for end in iter_squares(king_targets):
+                yield king_square | (end << 6)
+
+        checkers = bitboards.attackers_of(king_square, 1 - color)
+        if checkers & (checkers - 1):
+            return  # Only the king can answer a double check
+        if checkers:
+            targets = (checkers | BETWEEN[king_square][lsb(checkers)]) & ~own
+        else:
+            targets = ~own & FULL
+            if pieces[KING] & from_mask and to_mask == FULL:
+                yield from self._generate_castling_moves(color, king_square)
+        targets &= to_mask
+        pins = self._get_pins(color, king_square)
+
+        # En passant is only ever available to the side to move
+        to_move = color == (WHITE if self.white_to_move else BLACK)
+        yield from self._generate_pawn_moves(
+            color,
+            pieces[PAWN] & from_mask,
+            targets,
+            pins,
+            king_square,
+            self.ep_square if to_move and to_mask == FULL else None,
+        )
+        for start in iter_squares(pieces[KNIGHT] & from_mask):
+            if start not in pins:  # A pinned knight can never move
+                for end in iter_squares(KNIGHT_ATTACKS[start] & targets):
+                    yield start | (end << 6)
+        for piece_type, attacks in (
+            (BISHOP, bishop_attacks),
+            (ROOK, rook_attacks),
+            (QUEEN, queen_attacks),
+        ):
+            for start in iter_squares(pieces[piece_type] & from_mask):
+                allowed = targets & pins.get(start, FULL)
+                for end in iter_squares(attacks(start, occupied) & allowed):
+                    yield start | (end << 6)
+
+    ###############
+    # GAME END
+    ###############
+
+    def any_legal_move(self):
+        """
+        Whether the side to move has a legal move, stopping at the first one.
+        Most positions are answered by a safe king step. The steps are tried
+        one at a time rather than through the enemy's attack map, which is
+        dropped by every move and costs far more to rebuild.
+        """
+        color = WHITE if self.white_to_move else BLACK
+        bitboards = self.bitboards
+        kings = bitboards.pieces[color][KING]
+        for square in iter_squares(
+            KING_ATTACKS[lsb(kings)] & ~bitboards.occupancy[color]
+        ):
+            if not bitboards.is_attacked(square, 1 - color):
+                return True  # Castling needs a safe step too, so it is covered here
+        moves = self.iter_legal_moves(color, from_mask=FULL ^ kings)
+        return next(moves, None) is not None
+
+    def _count_position(self):
+        key = self.zobrist_key
+        self.position_counts[key] = self.position_counts.get(key, 0) + 1
+        self._position_keys.append(key)
+
+    def _uncount_position(self):
+        key = self._position_keys.pop()
+        count = self.position_counts[key] - 1
+        if count:
+            self.position_counts[key] = count
+        else:
+            del self.position_counts[key]
+
+    def repetitions(self):
+        """How many times the current position has occurred, itself included"""
+        return max(self.position_counts.get(self.zobrist_key, 0), 1)
+
+    def is_insufficient_material(self):
+        """
+        Neither side can mate: bare kings, a single minor piece, or only
+        bishops that all stand on squares of one color
+        """
+        pieces = self.bitboards.pieces
+        for color in (WHITE, BLACK):
+            if pieces[color][PAWN] | pieces[color][ROOK] | pieces[color][QUEEN]:
                 return False
-            current_row += row_step
-            current_col += col_step
-        return True
-
-    def _is_move_legal(self, piece, move):
-        """Legal moves are initially empty squares or enemy pieces (capture)"""
-        move_row, move_col = move
-        move_square = self.board[move_row][move_col]
-        if move_square is None or move_square.color != piece.color:
+        knights = pieces[WHITE][KNIGHT] | pieces[BLACK][KNIGHT]
+        bishops = pieces[WHITE][BISHOP] | pieces[BLACK][BISHOP]
+        minors = knights | bishops
+        if not minors & (minors - 1):
             return True
-        return False
+        return not knights and (
+            not bishops & LIGHT_SQUARES or not bishops & ~LIGHT_SQUARES
+        )
 
-    ### Get piece-specific legal moves ###
+    def outcome(self):
+        """
+        How the game has ended, or None while it goes on. Draws by the
+        fifty-move rule and threefold repetition are reported as soon as
+        they can be claimed.
+        """
+        if not self.any_legal_move():
+            if self.in_check():
+                return Outcome(CHECKMATE, self._get_color(opponent=True))
+            return Outcome(STALEMATE, None)
+        if self.is_insufficient_material():
+            return Outcome(INSUFFICIENT_MATERIAL, None)
+        if self.halfmove_clock >= 100:
+            return Outcome(FIFTY_MOVES, None)
+        # A position can only repeat twice after at least eight reversible plies
+        if self.halfmove_clock >= 8 and self.repetitions() >= 3:
+            return Outcome(THREEFOLD_REPETITION, None)
+        return None
 
-    def _get_pawn_legal_moves(self, pawn):
-        legal_moves = []
-        for move in pawn.potential_moves():
-            if (
-                self._is_legal_pawn_move(pawn, move)
-                and self._is_path_clear(pawn.position, move)
-                and self._is_move_legal(pawn, move)
-            ):
-                legal_moves.append(move)
-        en_passant_move = self._get_en_passant_move(pawn)
-        if en_passant_move:
-            legal_moves.append(en_passant_move)
-        return legal_moves
-
-    def _get_king_legal_moves(self, king):
-        legal_moves = []
-        for move in king.potential_moves():
-            if self._is_path_clear(king.position, move) and self._is_move_legal(
-                king, move
-            ):
-                if self._is_castle_legal(king) and abs(king.position[1] - move[1]) > 1:
-                    legal_moves.append(move)
-                if abs(king.position[1] - move[1]) == 1 or king.position[0] != move[0]:
-                    legal_moves.append(move)
-        return legal_moves
-
-    def _get_knight_legal_moves(self, knight):
-        return [
-            move
-            for move in knight.potential_moves()
-            if self._is_move_legal(knight, move)
-        ]
-
-    def _get_default_legal_moves(self, piece):
-        return [
-            move
-            for move in piece.potential_moves()
-            if self._is_move_legal(piece, move)
-            and self._is_path_clear(piece.position, move)
-        ]
-
-    def _get_legal_moves(self, piece: Piece):
+    ###############
+    # HASHING
+    ###############
+
+    @property
+    def zobrist_key(self):
         """
-        Delete moves from potential_moves that are not legal
+        64-bit hash of the position. The placement part is kept up to date by
+        every write to the board; side to move, castling rights and the en
+        passant file are folded in from their own keys.
         """
-        if isinstance(piece, Pawn):
-            return self._get_pawn_legal_moves(piece)
-        elif isinstance(piece, King):
-            return self._get_king_legal_moves(piece)
-        elif isinstance(piece, Knight):
-            return self._get_knight_legal_moves(piece)
-        else:
-            return self._get_default_legal_moves(piece)
+        key = self.bitboards.key ^ CASTLING_KEYS[self.castling_rights]
+        if not self.white_to_move:
+            key ^= BLACK_TO_MOVE_KEY
+        if self.ep_square is not None and self._can_capture_en_passant():
+            key ^= EN_PASSANT_KEYS[self.ep_square & 7]
+        return key
+
+    def _can_capture_en_passant(self):
+        """Only hash the en passant file when a pawn could actually use it"""
+        color = WHITE if self.white_to_move else BLACK
+        pawns = self.bitboards.pieces[color][PAWN]
+        return PAWN_ATTACKS[1 - color][self.ep_square] & pawns != 0
 
     ###############
-    # CHECK
+    # SERIALIZATION
     ###############
 
-    def _get_king_position(self, opponent_king=True):
-        king_color = self._get_color(opponent_king)
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if isinstance(piece, King) and piece.color == king_color:
-                    return (row, col)
-        return None
+    def _load_placement(self, placement):
+        """
+        Fill an empty board from (square, color, piece_type) triples. The
+        grid and bitboards are written directly, which is much cheaper than
+        setting the squares one at a time through BoardRow.
+        """
+        bitboards = self.bitboards
+        pieces, mailbox = bitboards.pieces, bitboards.mailbox
+        key = score = 0
+        for square, color, piece_type in placement:
+            pieces[color][piece_type] |= 1 << square
+            mailbox[square] = 1 + 6 * color + piece_type
+            key ^= PIECE_KEYS[color][piece_type][square]
+            score += SQUARE_SCORES[color][piece_type][square]
+        bitboards.key = key
+        bitboards.score = score
+        bitboards.rebuild()
+
+    def to_bytes(self):
+        """Compact snapshot of the position for sending to other processes"""
+        pieces = self.bitboards.pieces
+        return PACKED_POSITION.pack(
+            *pieces[WHITE],
+            *pieces[BLACK],
+            BLACK if not self.white_to_move else WHITE,
+            self.castling_rights,
+            255 if self.ep_square is None else self.ep_square,
+            min(self.halfmove_clock, 0xFFFF),
+            min(self.fullmove_number, 0xFFFF),
+        )
 
-    def _update_check_status(self, is_check):
-        if self.white_to_move:
-            self.check_black = is_check
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a position from to_bytes(); the move history is not included"""
+        fields = PACKED_POSITION.unpack(data)
+        board = cls(empty=True)
+        board._load_placement(
+            (square, color, piece_type)
+            for color in (WHITE, BLACK)
+            for piece_type in range(6)
+            for square in iter_squares(fields[6 * color + piece_type])
+        )
+        (
+            side,
+            board.castling_rights,
+            ep_square,
+            board.halfmove_clock,
+            board.fullmove_number,
+        ) = fields[12:]
+        board.white_to_move = side == WHITE
+        board.ep_square = None if ep_square == 255 else ep_square
+        return board
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Set up a position from Forsyth-Edwards Notation. The halfmove clock
+        and fullmove number may be left off and default to 0 and 1.
+        Raises ValueError for a malformed FEN.
+        """
+        fields = fen.split()
+        if len(fields) == 4:
+            fields += ["0", "1"]
+        if len(fields) != 6:
+            raise ValueError(f"FEN needs 4 or 6 fields: {fen!r}")
+        placement, side, castling, en_passant, halfmove, fullmove = fields
+
+        ranks = placement.split("/")
+        if len(ranks) != 8:
+            raise ValueError(f"FEN placement needs 8 ranks: {fen!r}")
+        placement = []
+        for row, rank in enumerate(ranks):
+            square = row * 8
+            for char in rank:
+                if char in "12345678":
+                    square += int(char)
+                    continue
+                piece = FEN_SYMBOLS.get(char)
+                if piece is None:
+                    raise ValueError(f"Unknown piece {char!r} in FEN: {fen!r}")
+                if square >= row * 8 + 8:
+                    raise ValueError(f"FEN rank {rank!r} is too long: {fen!r}")
+                placement.append((square, *piece))
+                square += 1
+            if square != row * 8 + 8:
+                raise ValueError(f"FEN rank {rank!r} is not 8 squares: {fen!r}")
+
+        if side not in ("w", "b"):
+            raise ValueError(f"Side to move must be w or b: {fen!r}")
+        castling_rights = 0
+        if castling != "-":
+            for char in castling:
+                rights = FEN_CASTLING.get(char)
+                if rights is None:
+                    raise ValueError(f"Unknown castling right {char!r}: {fen!r}")
+                castling_rights |= rights
+        if en_passant == "-":
+            ep_square = None
+        elif (
+            len(en_passant) == 2
+            and en_passant[0] in "abcdefgh"
+            and en_passant[1] in "36"
+        ):
+            ep_square = parse_square(en_passant)
         else:
-            self.check_white = is_check
-
-    def _search_for_check(self, opponent_king=True, simulate=False):
-        """Check if the specified king is in check."""
-        king_color = self._get_color(opponent_king)
-        king_position = self._get_king_position(opponent_king)
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece is None or piece.color == king_color:
+            raise ValueError(f"Bad en passant square {en_passant!r}: {fen!r}")
+        if not (halfmove.isdigit() and fullmove.isdigit()):
+            raise ValueError(f"FEN move counters must be numbers: {fen!r}")
+
+        board = cls(empty=True)
+        board._load_placement(placement)
+        board.white_to_move = side == "w"
+        board.castling_rights = castling_rights
+        board.ep_square = ep_square
+        board.halfmove_clock = int(halfmove)
+        board.fullmove_number = max(int(fullmove), 1)
+        return board
+
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank, empty = "", 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
                     continue
-                if king_position in self._get_legal_moves(piece):
-                    if not simulate:
-                        self._update_check_status(True)
-                    return True
-        if not simulate:
-            self._update_check_status(False)
-        return False
-
-    def _simulate_move(self, piece: Piece, move: tuple):
-        original_position = piece.position
-        destination_piece = self.board[move[0]][move[1]]
-        self.board[original_position[0]][original_position[1]] = None
-        self.board[move[0]][move[1]] = piece
-        piece.position = move
-        return original_position, destination_piece
-
-    def _revert_simulated_move(
-        self, piece: Piece, original_position: tuple, destination_piece: Piece
-    ):
-        self.board[piece.position[0]][piece.position[1]] = destination_piece
-        self.board[original_position[0]][original_position[1]] = piece
-        piece.position = original_position
-
-    def filter_legal_moves_for_check(self, piece: Piece):
-        allowed_moves = []
-        for move in self._get_legal_moves(piece):
-            original_position, destination_piece = self._simulate_move(piece, move)
-            if not self._search_for_check(opponent_king=False, simulate=True):
-                allowed_moves.append(move)
-            self._revert_simulated_move(piece, original_position, destination_piece)
-        return allowed_moves
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += FEN_PIECES[COLORS[piece.color]][piece.piece_type]
+            ranks.append(rank + str(empty) if empty else rank)
+        castling = "".join(
+            char
+            for char, rights in FEN_CASTLING.items()
+            if self.castling_rights & rights
+        )
+        return " ".join(
+            (
+                "/".join(ranks),
+                "w" if self.white_to_move else "b",
+                castling or "-",
+                "-" if self.ep_square is None else square_name(self.ep_square),
+                str(self.halfmove_clock),
+                str(self.fullmove_number),
+            )
+        )
 
     ###############
-    # MOVING
+    # MAKE / UNMAKE
     ###############
 
-    def _finalize_move(self, moving_piece):
-        self.last_to_move = copy(moving_piece)
-        if moving_piece.first_move:
-            moving_piece.first_move = False
+    def make_move(self, move: int):
+        """
+        Play an encoded move (see moves.py) without checking that it is legal.
+        Everything needed to take it back is pushed onto the undo stack.
+        """
+        start, end = move_start(move), move_end(move)
+        start_row, start_col = divmod(start, 8)
+        end_row, end_col = divmod(end, 8)
+        piece = self.board[start_row][start_col]
+        # En passant captures the pawn beside the moving pawn, not on the end square
+        capture_row = end_row
+        if end == self.ep_square and isinstance(piece, Pawn) and start_col != end_col:
+            capture_row = start_row
+        captured = self.board[capture_row][end_col]
+        if not self._position_keys:
+            self._count_position()
+        self._undo_stack.append(
+            (
+                move,
+                piece,
+                captured,
+                capture_row,
+                self.castling_rights,
+                self.ep_square,
+                self.halfmove_clock,
+                self.bitboards.attack_maps[WHITE],
+                self.bitboards.attack_maps[BLACK],
+            )
+        )
+
+        if captured is not None:
+            self.board[capture_row][end_col] = None
+        self.board[start_row][start_col] = None
+        promotion = move_promotion(move)
+        if promotion:
+            self.board[end_row][end_col] = PIECE_CLASSES[promotion](piece.color)
+        else:
+            self.board[end_row][end_col] = piece
+        if isinstance(piece, King) and abs(end_col - start_col) == 2:
+            self._move_rook_for_castling(start_row, kingside=end_col > start_col)
 
-    def _update_game_state_after_move(self):
-        self._search_for_check(opponent_king=True)
+        self.castling_rights &= CASTLING_MASKS[start] & CASTLING_MASKS[end]
+        if isinstance(piece, Pawn) and abs(end_row - start_row) == 2:
+            self.ep_square = (start + end) // 2
+        else:
+            self.ep_square = None
+        if captured is not None or isinstance(piece, Pawn):
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not self.white_to_move:
+            self.fullmove_number += 1
         self.white_to_move = not self.white_to_move
-        self.en_passant_squares = []
+        self.move_log.append(move)
+        self._count_position()
+
+    def unmake_move(self):
+        """Take back the last move played with make_move"""
+        (
+            move,
+            piece,
+            captured,
+            capture_row,
+            self.castling_rights,
+            self.ep_square,
+            self.halfmove_clock,
+            white_attacks,
+            black_attacks,
+        ) = self._undo_stack.pop()
+        self.move_log.pop()
+        self._uncount_position()
+        if not self._undo_stack:
+            self._uncount_position()  # The start position, counted by make_move
+        start_row, start_col = divmod(move_start(move), 8)
+        end_row, end_col = divmod(move_end(move), 8)
+        self.white_to_move = not self.white_to_move
+        if not self.white_to_move:
+            self.fullmove_number -= 1
+
+        if isinstance(piece, King) and abs(end_col - start_col) == 2:
+            self._move_rook_for_castling(start_row, end_col > start_col, undo=True)
+        self.board[end_row][end_col] = None
+        self.board[start_row][start_col] = piece
+        if captured is not None:
+            self.board[capture_row][end_col] = captured
+        # The attack maps from before the move are valid again
+        self.bitboards.attack_maps[WHITE] = white_attacks
+        self.bitboards.attack_maps[BLACK] = black_attacks
+        return move
+
+    ###############
+    # MOVING
+    ###############
 
     def capture_piece(self, position):
         self.board[position[0]][position[1]] = None
 
     def move_piece(self, start: tuple, end: tuple):
+        """Play a move given as (row, col) squares; illegal moves are ignored"""
         moving_piece = self.board[start[0]][start[1]]
-        if isinstance(moving_piece, King) and abs(start[1] - end[1]) > 1:
-            self._move_pieces_for_castling(moving_piece, end)
-        else:
-            self._simulate_move(moving_piece, end)
-            self._promote_pawn_if_eligible(moving_piece, end)
-            self._finalize_move(moving_piece)
-            self._update_game_state_after_move()
+        promotion = self._get_promotion(moving_piece, end)
+        move = encode_move(square_index(start), square_index(end), promotion)
+        if move not in self.legal_moves():
+            return
+        self.make_move(move)
+        self.en_passant_squares = []
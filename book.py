@@ -0,0 +1,242 @@
+"""
+Opening books in the Polyglot .bin layout: 16-byte big-endian records of
+(position key, move, weight, learn), sorted by key. A book is memory-mapped
+read-only and probed by binary search, so opening one costs nothing however
+large it is, and every process on a host shares the same pages through the
+page cache.
+
+Keys are Polyglot's own (see polyglot.py), so books built by other
+Polyglot tools can be probed and books built here work elsewhere.
+
+    python book.py build games.pgn book.bin --plies 16
+    python book.py probe book.bin --fen "<fen>"
+
+    with OpeningBook("book.bin") as book:
+        move = book.choose(board)  # None once out of book
+"""
+
+import argparse
+import bisect
+import collections
+import mmap
+import os
+import random
+import struct
+import sys
+
+from board import BoardState
+from bitboard import WHITE, BLACK, KING
+from moves import encode_move, move_start, move_end, move_promotion, move_to_uci
+from pgn import IllegalMoveError, move_from_san, read_games
+from polyglot import polyglot_key, polyglot_square
+
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}  # (white, black)
+
+
+###############
+# MOVES
+###############
+
+
+def _board_square(square):
+    """Inverse of polyglot_square"""
+    rank, file = divmod(square, 8)
+    return (7 - rank) * 8 + file
+
+
+def _is_king(board, square):
+    color = WHITE if board.white_to_move else BLACK
+    return board.bitboards.piece_type_at(square, color) == KING
+
+
+def encode_book_move(board, move):
+    """Polyglot's 16-bit move; castling is written as the king taking its rook"""
+    start, end = move_start(move), move_end(move)
+    if abs(end - start) == 2 and _is_king(board, start):
+        end = start + 3 if end > start else start - 4
+    return (
+        polyglot_square(end) | polyglot_square(start) << 6 | move_promotion(move) << 12
+    )
+
+
+def decode_book_move(board, book_move):
+    """The legal move book_move stands for in board's position, or None"""
+    start = _board_square(book_move >> 6 & 63)
+    end = _board_square(book_move & 63)
+    if end in (start + 3, start - 4) and _is_king(board, start):
+        end = start + 2 if end > start else start - 2
+    move = encode_move(start, end, book_move >> 12 & 7)
+    return move if move in board.legal_moves() else None
+
+
+###############
+# PROBING
+###############
+
+
+class _Keys:
+    """The book's keys as a sequence, read straight out of the map"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // ENTRY.size
+
+    def __getitem__(self, index):
+        return KEY.unpack_from(self.data, index * ENTRY.size)[0]
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as stream:
+            size = os.fstat(stream.fileno()).st_size
+            if size % ENTRY.size:
+                raise ValueError(f"{path} is not a book: {size} bytes")
+            # An empty file cannot be mapped, and has nothing to find anyway
+            self._map = (
+                mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            )
+        self._keys = _Keys(self._map if self._map is not None else b"")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._keys = _Keys(b"")
+
+    def entries(self, board):
+        """(move, weight, learn) for each legal book move, best weighted first"""
+        key = polyglot_key(board)
+        index = bisect.bisect_left(self._keys, key)
+        found = []
+        while index < len(self._keys):
+            entry_key, book_move, weight, learn = ENTRY.unpack_from(
+                self._map, index * ENTRY.size
+            )
+            if entry_key != key:
+                break
+            move = decode_book_move(board, book_move)
+            if move is not None:
+                found.append((move, weight, learn))
+            index += 1
+        found.sort(key=lambda entry: -entry[1])
+        return found
+
+    def choose(self, board, rng=random, best=False):
+        """
+        A book move for board, picked with probability proportional to its
+        weight (or the heaviest with best=True); None when out of book.
+        """
+        found = [entry for entry in self.entries(board) if entry[1]]
+        if not found:
+            return None
+        if best:
+            return found[0][0]
+        moves, weights, _ = zip(*found)
+        return rng.choices(moves, weights)[0]
+
+
+###############
+# BUILDING
+###############
+
+
+def build_book(games, path, plies=16, min_games=1):
+    """
+    Write a book of the first plies moves of games (an iterable such as
+    read_games). A move's weight is two points for each game its side won
+    and one per draw or unfinished game, scaled to fit 16 bits; moves seen
+    in fewer than min_games games are left out. Returns the number of entries written.
+    """
+    counts = collections.Counter()  # (key, book move) -> games
+    points = collections.Counter()
+    for game in games:
+        result = RESULT_POINTS.get(game.result, (1, 1))
+        fen = game.headers.get("FEN")
+        try:
+            board = BoardState.from_fen(fen) if fen else BoardState()
+            for san in game.moves[:plies]:
+                move = move_from_san(board, san)
+                entry = (polyglot_key(board), encode_book_move(board, move))
+                counts[entry] += 1
+                points[entry] += result[0 if board.white_to_move else 1]
+                board.make_move(move)
+        except (IllegalMoveError, ValueError):
+            continue  # Keep the moves played up to the error
+
+    by_position = collections.defaultdict(list)
+    for entry, games_seen in counts.items():
+        if games_seen >= min_games:
+            by_position[entry[0]].append((entry[1], points[entry]))
+    records = []
+    for key, moves in by_position.items():
+        top = max(weight for _, weight in moves)
+        scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+        for book_move, weight in moves:
+            records.append((key, -int(weight * scale), book_move))
+    records.sort()
+
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as stream:
+        for key, weight, book_move in records:
+            stream.write(ENTRY.pack(key, book_move, -weight, 0))
+    os.replace(partial, path)
+    return len(records)
+
+
+###############
+# CLI
+###############
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile a book from PGN")
+    build.add_argument("pgn", help="PGN file, or - for stdin")
+    build.add_argument("book")
+    build.add_argument("--plies", type=int, default=16, help="moves kept per game")
+    build.add_argument("--min-games", type=int, default=1)
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", help="position (default: the start position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.pgn == "-":
+            written = build_book(
+                read_games(sys.stdin), args.book, args.plies, args.min_games
+            )
+        else:
+            with open(args.pgn, encoding="utf-8", errors="replace") as stream:
+                written = build_book(
+                    read_games(stream), args.book, args.plies, args.min_games
+                )
+        print(f"{written} entries written to {args.book}")
+    else:
+        board = BoardState.from_fen(args.fen) if args.fen else BoardState()
+        with OpeningBook(args.book) as book:
+            entries = book.entries(board)
+        total = sum(weight for _, weight, _ in entries) or 1
+        for move, weight, _ in entries:
+            print(f"{move_to_uci(move):<6} {weight:>6}  {weight / total:6.1%}")
+        if not entries:
+            print("out of book")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Position datasets: files of fixed-width 32-byte records, one per position,
+for training data and regression suites of any size. A record holds the
+placement, side to move, castling rights, en passant square and both clocks:
+
+    occupied   8 bytes   bitboard of the occupied squares, little-endian
+    pieces    16 bytes   mailbox code (1-12) of each occupied square in
+                         square order, two per byte, low nibble first
+    flags      1 byte    castling rights in bits 0-3, black to move in bit 4
+    ep         1 byte    en passant square, 255 for none
+    halfmove   2 bytes
+    fullmove   2 bytes
+    reserved   2 bytes   zero
+
+Positions with more than 32 pieces cannot be stored. The file starts with a
+32-byte header so records stay aligned. Files are appended to with
+PositionWriter and read through mmap by PositionDataset, where position i is
+found at a fixed offset, so any index (for shuffling or sharding across
+workers) is reached in O(1):
+
+    with PositionWriter("positions.bin") as writer:
+        writer.append(board)
+
+    with PositionDataset("positions.bin") as dataset:
+        board = dataset[12345]
+        shard = range(worker, len(dataset), workers)
+
+    python dataset.py build games.pgn positions.bin   # every position played
+    python dataset.py show positions.bin 0 -1
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from board import BoardState
+from bitboard import iter_squares
+from pgn import IllegalMoveError, move_from_san, read_games
+
+MAGIC = b"CPOS"
+VERSION = 1
+HEADER = struct.Struct("<4sHH24x")  # magic, version, record size
+RECORD = struct.Struct("<Q16sBBHH2x")
+MAX_PIECES = 32
+BLACK_TO_MOVE = 16
+NO_EP_SQUARE = 255
+
+# Mailbox code -> (color, piece_type)
+CODE_PIECES = (None,) + tuple(divmod(code, 6) for code in range(12))
+
+assert HEADER.size == RECORD.size == 32
+
+
+###############
+# RECORDS
+###############
+
+
+def pack_position(board):
+    """The 32-byte record of board's position; raises ValueError past 32 pieces"""
+    codes = [code for code in board.bitboards.mailbox if code]
+    if len(codes) > MAX_PIECES:
+        raise ValueError(f"{len(codes)} pieces do not fit in a record")
+    codes += [0] * (MAX_PIECES - len(codes))
+    pieces = bytes(low | high << 4 for low, high in zip(codes[::2], codes[1::2]))
+    flags = board.castling_rights | (0 if board.white_to_move else BLACK_TO_MOVE)
+    return RECORD.pack(
+        board.bitboards.occupied,
+        pieces,
+        flags,
+        NO_EP_SQUARE if board.ep_square is None else board.ep_square,
+        min(board.halfmove_clock, 0xFFFF),
+        min(board.fullmove_number, 0xFFFF),
+    )
+
+
+def unpack_position(data, offset=0):
+    """A BoardState from the record at offset in data; no move history"""
+    occupied, pieces, flags, ep_square, halfmove, fullmove = RECORD.unpack_from(
+        data, offset
+    )
+    codes = []
+    for byte in pieces:
+        codes += (byte & 15, byte >> 4)
+    placement = []
+    for square, code in zip(iter_squares(occupied), codes):
+        piece = CODE_PIECES[code] if code <= 12 else None
+        if piece is None:
+            raise ValueError(f"bad piece code {code} in record")
+        placement.append((square, *piece))
+    board = BoardState(empty=True)
+    board._load_placement(placement)
+    board.castling_rights = flags & 15
+    board.white_to_move = not flags & BLACK_TO_MOVE
+    board.ep_square = None if ep_square == NO_EP_SQUARE else ep_square
+    board.halfmove_clock = halfmove
+    board.fullmove_number = fullmove
+    return board
+
+
+###############
+# FILES
+###############
+
+
+def _check_header(data, path):
+    magic, version, record_size = HEADER.unpack_from(data)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a position dataset")
+    if version != VERSION:
+        raise ValueError(f"{path} is dataset version {version}, not {VERSION}")
+
+
+class PositionWriter:
+    """Appends positions to a dataset, creating it if needed"""
+
+    def __init__(self, path):
+        self.path = path
+        self._stream = open(path, "ab+")
+        self._stream.seek(0)
+        header = self._stream.read(HEADER.size)
+        if header:
+            size = os.fstat(self._stream.fileno()).st_size
+            if size < HEADER.size or (size - HEADER.size) % RECORD.size:
+                self._stream.close()
+                raise ValueError(f"{path} is not a position dataset: {size} bytes")
+            _check_header(header, path)
+        else:
+            self._stream.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, board):
+        self._stream.write(pack_position(board))
+        self.written += 1
+
+    def extend(self, boards):
+        records = [pack_position(board) for board in boards]
+        self._stream.write(b"".join(records))
+        self.written += len(records)
+
+    def flush(self):
+        self._stream.flush()
+
+    def close(self):
+        self._stream.close()
+
+
+class PositionDataset:
+    """
+    Read-only view of a dataset file through mmap. Indexing decodes one
+    record into a BoardState; record() and array() give the raw bytes.
+    Positions appended after opening are not seen.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as stream:
+            size = os.fstat(stream.fileno()).st_size
+            if size < HEADER.size or (size - HEADER.size) % RECORD.size:
+                raise ValueError(f"{path} is not a position dataset: {size} bytes")
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        _check_header(self._map, path)
+        self._length = (size - HEADER.size) // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._length
+
+    def _offset(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("position index out of range")
+        return HEADER.size + index * RECORD.size
+
+    def __getitem__(self, index):
+        return unpack_position(self._map, self._offset(index))
+
+    def __iter__(self):
+        for offset in range(HEADER.size, len(self._map), RECORD.size):
+            yield unpack_position(self._map, offset)
+
+    def record(self, index):
+        offset = self._offset(index)
+        return self._map[offset : offset + RECORD.size]
+
+    def array(self):
+        """
+        Every record as a NumPy structured array (see record_dtype) that
+        reads straight from the mapped file, without copying. Arrays must
+        be dropped before the dataset is closed.
+        """
+        import numpy as np
+
+        return np.frombuffer(
+            self._map, dtype=record_dtype(), count=self._length, offset=HEADER.size
+        )
+
+    def close(self):
+        self._map.close()
+
+
+###############
+# NUMPY
+###############
+
+
+def record_dtype():
+    import numpy as np
+
+    return np.dtype(
+        [
+            ("occupied", "<u8"),
+            ("pieces", "u1", (16,)),
+            ("flags", "u1"),
+            ("ep", "u1"),
+            ("halfmove", "<u2"),
+            ("fullmove", "<u2"),
+            ("reserved", "u1", (2,)),
+        ]
+    )
+
+
+def mailboxes_from_records(records):
+    """
+    (N, 64) uint8 mailbox codes from a record array, as taken by
+    evaluation.evaluate_batch. Unlike array() this builds a new array.
+    """
+    import numpy as np
+
+    records = np.asarray(records)
+    occupied = records["occupied"].astype("<u8").view(np.uint8).reshape(-1, 8)
+    bits = np.unpackbits(occupied, axis=1, bitorder="little").astype(bool)
+    pieces = records["pieces"]
+    codes = np.stack((pieces & 15, pieces >> 4), axis=2).reshape(-1, MAX_PIECES)
+    # The k-th occupied square holds the k-th code
+    rank = np.minimum(np.cumsum(bits, axis=1) - 1, MAX_PIECES - 1)
+    return np.where(bits, np.take_along_axis(codes, rank, axis=1), 0).astype(np.uint8)
+
+
+def side_to_move(records):
+    """True for each record with white to move, for evaluate_batch"""
+    import numpy as np
+
+    return (np.asarray(records)["flags"] & BLACK_TO_MOVE) == 0
+
+
+###############
+# CLI
+###############
+
+
+def write_games(games, writer):
+    """Append every position reached in games (such as read_games); returns the count"""
+    written = writer.written
+    for game in games:
+        fen = game.headers.get("FEN")
+        try:
+            board = BoardState.from_fen(fen) if fen else BoardState()
+            writer.append(board)
+            for san in game.moves:
+                board.make_move(move_from_san(board, san))
+                writer.append(board)
+        except (IllegalMoveError, ValueError):
+            continue  # Keep the positions reached before the error
+    return writer.written - written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or read a position dataset")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="append the positions of PGN games")
+    build.add_argument("pgn", help="PGN file, or - for stdin")
+    build.add_argument("dataset")
+    show = commands.add_parser("show", help="print positions as FEN")
+    show.add_argument("dataset")
+    show.add_argument("indices", nargs="*", type=int, help="default: the size only")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with PositionWriter(args.dataset) as writer:
+            if args.pgn == "-":
+                written = write_games(read_games(sys.stdin), writer)
+            else:
+                with open(args.pgn, encoding="utf-8", errors="replace") as stream:
+                    written = write_games(read_games(stream), writer)
+        print(f"{written} positions written to {args.dataset}")
+    else:
+        with PositionDataset(args.dataset) as dataset:
+            print(f"{len(dataset)} positions")
+            for index in args.indices:
+                print(f"{index}: {dataset[index].to_fen()}")
+
+
+if __name__ == "__main__":
+    main()
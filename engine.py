@@ -0,0 +1,382 @@
+"""
+Alpha-beta search over BoardState.
+
+Negamax with iterative deepening and quiescence search on captures. A bounded
+transposition table remembers earlier results, and moves are ordered hash
+move first, then captures (most valuable victim, least valuable attacker),
+promotions, killer moves and finally by the history heuristic.
+
+    engine = Engine(hash_mb=16)
+    result = engine.search(board, movetime=1.0)
+    result.best_move, result.pv, result.nps, result.tt_hit_rate
+"""
+
+import threading
+import time
+from typing import NamedTuple
+
+from bitboard import WHITE, BLACK
+from evaluation import evaluate
+
+MATE_SCORE = 30000
+MATE_BOUND = MATE_SCORE - 1000  # Scores beyond this are mates in some number of ply
+INFINITY = 32000
+MAX_PLY = 64
+EXACT, LOWER, UPPER = 1, 2, 3  # 0 marks an empty table slot
+CHECK_EVERY = 1024  # Nodes between looks at the clock and the stop flag
+
+
+###############
+# TRANSPOSITION TABLE
+###############
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results, two 64-bit words per slot: the packed
+    entry (move, score, depth, bound, age) and the key XORed with it, so that
+    a slot half-written by another process never matches. The slot comes
+    from the low bits of the key. A new entry replaces an old one that is
+    from an earlier search or was searched no deeper.
+
+    buffer, if given, is any writable buffer of 16 * slots bytes (for
+    example shared memory) and slots must be a power of two.
+    """
+
+    def __init__(self, size_mb=16, buffer=None):
+        if buffer is None:
+            buffer = bytearray(self.buffer_size(size_mb))
+        self._bytes = memoryview(buffer).cast("B")
+        self.table = self._bytes.cast("Q")
+        self.mask = len(self.table) // 2 - 1
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    @staticmethod
+    def buffer_size(size_mb):
+        """Bytes needed for the largest power-of-two table within size_mb"""
+        slots = max(1, size_mb * 1024 * 1024 // 16)
+        return 16 * (1 << (slots.bit_length() - 1))
+
+    def __len__(self):
+        return self.mask + 1
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+        self.probes = self.hits = 0
+
+    def clear(self):
+        self._bytes[:] = bytes(len(self._bytes))
+
+    def probe(self, key):
+        """(move, score, depth, bound) stored for key, or None"""
+        self.probes += 1
+        index = (key & self.mask) << 1
+        entry = self.table[index + 1]
+        if not entry or self.table[index] ^ entry != key:
+            return None
+        self.hits += 1
+        return (
+            entry & 0x7FFF,
+            ((entry >> 15) & 0xFFFF) - 0x8000,
+            (entry >> 31) & 0xFF,
+            (entry >> 39) & 0x3,
+        )
+
+    def store(self, key, move, score, depth, bound):
+        index = (key & self.mask) << 1
+        old_entry = self.table[index + 1]
+        same_key = old_entry and self.table[index] ^ old_entry == key
+        if (
+            old_entry
+            and not same_key
+            and (old_entry >> 41) & 0xFF == self.age
+            and (old_entry >> 31) & 0xFF > depth
+        ):
+            return  # Keep the deeper result from this search
+        if not move and same_key:
+            move = old_entry & 0x7FFF  # Do not forget a known best move
+        entry = (
+            move
+            | ((score + 0x8000) << 15)
+            | (max(depth, 0) << 31)
+            | (bound << 39)
+            | (self.age << 41)
+        )
+        self.table[index] = key ^ entry
+        self.table[index + 1] = entry
+
+    def hashfull(self):
+        """Permille of sampled slots written during the current search"""
+        sample = min(1000, len(self))
+        used = sum(
+            1
+            for index in range(sample)
+            if self.table[2 * index + 1]
+            and (self.table[2 * index + 1] >> 41) & 0xFF == self.age
+        )
+        return used * 1000 // sample
+
+
+def _score_to_tt(score, ply):
+    """Mate scores are stored relative to the node, not the root"""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+###############
+# SEARCH
+###############
+
+
+class SearchResult(NamedTuple):
+    best_move: int  # None when the side to move has no legal move
+    score: int  # Centipawns for the side to move
+    depth: int
+    pv: list
+    nodes: int
+    seconds: float
+    tt_probes: int
+    tt_hits: int
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.seconds) if self.seconds else 0
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+
+class SearchStopped(Exception):
+    pass
+
+
+class Engine:
+    def __init__(self, hash_mb=16, tt=None, stop_event=None):
+        """
+        tt and stop_event may be shared with other engines; a stop_event that
+        is passed in is never cleared here, that is left to its owner.
+        """
+        self.tt = tt if tt is not None else TranspositionTable(hash_mb)
+        self._owns_stop_event = stop_event is None
+        self.stop_event = threading.Event() if stop_event is None else stop_event
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [[0] * 4096, [0] * 4096]  # [color][start + 64 * end]
+        self.pv = [[] for _ in range(MAX_PLY + 2)]
+
+    def stop(self):
+        """Ask a running search to return as soon as possible"""
+        self.stop_event.set()
+
+    def new_game(self):
+        self.tt.clear()
+        self.history = [[0] * 4096, [0] * 4096]
+
+    ### Budget ###
+
+    def _check_budget(self):
+        if self.nodes >= self._node_limit:
+            raise SearchStopped
+        if self.nodes % CHECK_EVERY == 0 and (
+            self.stop_event.is_set() or time.perf_counter() >= self._deadline
+        ):
+            raise SearchStopped
+
+    ### Move ordering ###
+
+    def _order_moves(self, board, moves, tt_move, ply):
+        color = WHITE if board.white_to_move else BLACK
+        bitboards = board.bitboards
+        enemy = bitboards.occupancy[1 - color]
+        killers = self.killers[ply]
+        history = self.history[color]
+        scored = []
+        for move in moves:
+            start, end = move & 63, (move >> 6) & 63
+            if move == tt_move:
+                score = 1_000_000
+            elif enemy >> end & 1:
+                victim = bitboards.piece_type_at(end, 1 - color)
+                attacker = bitboards.piece_type_at(start, color)
+                score = 100_000 + 10 * victim - attacker
+            elif move >> 12:
+                score = 90_000 + (move >> 12)
+            elif move == killers[0]:
+                score = 80_001
+            elif move == killers[1]:
+                score = 80_000
+            else:
+                score = history[start + 64 * end]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def _update_quiet_move_stats(self, board, move, depth, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        color = WHITE if board.white_to_move else BLACK
+        index = (move & 63) + 64 * ((move >> 6) & 63)
+        self.history[color][index] = min(
+            self.history[color][index] + depth * depth, 79_999
+        )
+
+    ### Tree search ###
+
+    def _quiescence(self, board, alpha, beta, ply):
+        self.nodes += 1
+        self._check_budget()
+        if ply >= MAX_PLY:
+            return evaluate(board)  # Even in check: the ply tables end here
+        in_check = board.in_check()
+        if in_check:
+            moves = board.generate_legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            best_score = -INFINITY
+        else:
+            best_score = evaluate(board)
+            if best_score >= beta:
+                return best_score
+            alpha = max(alpha, best_score)
+            color = WHITE if board.white_to_move else BLACK
+            moves = board.generate_legal_moves(
+                to_mask=board.bitboards.occupancy[1 - color]
+            )
+        for move in self._order_moves(board, moves, 0, ply):
+            board.make_move(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self.pv[ply] = []
+        in_check = board.in_check()
+        if in_check:
+            depth += 1  # Never drop into quiescence while in check
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiescence(board, alpha, beta, ply)
+        self.nodes += 1
+        self._check_budget()
+
+        key = board.zobrist_key
+        entry = self.tt.probe(key)
+        tt_move = 0
+        if entry is not None:
+            tt_move, tt_score, tt_depth, bound = entry
+            if ply and tt_depth >= depth:
+                score = _score_from_tt(tt_score, ply)
+                if (
+                    bound == EXACT
+                    or (bound == LOWER and score >= beta)
+                    or (bound == UPPER and score <= alpha)
+                ):
+                    return score
+
+        moves = board.generate_legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, 0
+        color = WHITE if board.white_to_move else BLACK
+        enemy = board.bitboards.occupancy[1 - color]
+        for move in self._order_moves(board, moves, tt_move, ply):
+            board.make_move(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if score >= beta:
+                        if not enemy >> ((move >> 6) & 63) & 1:
+                            self._update_quiet_move_stats(board, move, depth, ply)
+                        break
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, best_move, _score_to_tt(best_score, ply), depth, bound)
+        return best_score
+
+    ### Iterative deepening ###
+
+    def search(
+        self, board, depth=None, nodes=None, movetime=None, info=None, min_depth=1
+    ):
+        """
+        Search board in place (it is restored before returning) until depth
+        is reached, nodes have been searched, movetime seconds have passed or
+        stop() is called. info, if given, is called with a SearchResult after
+        every completed depth. Iterative deepening starts at min_depth.
+        """
+        started = time.perf_counter()
+        if self._owns_stop_event:
+            self.stop_event.clear()
+        self.tt.new_search()
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self._node_limit = nodes if nodes is not None else float("inf")
+        self._deadline = started + movetime if movetime is not None else float("inf")
+        max_depth = min(depth or MAX_PLY, MAX_PLY)
+        undo_depth = len(board._undo_stack)
+
+        root_moves = board.generate_legal_moves()
+        if not root_moves:
+            score = -MATE_SCORE if board.in_check() else 0
+            return SearchResult(None, score, 0, [], 0, 0.0, 0, 0)
+        result = SearchResult(root_moves[0], 0, 0, [root_moves[0]], 0, 0.0, 0, 0)
+        for iteration in range(min(min_depth, max_depth), max_depth + 1):
+            try:
+                score = self._negamax(board, iteration, -INFINITY, INFINITY, 0)
+            except SearchStopped:
+                while len(board._undo_stack) > undo_depth:
+                    board.unmake_move()
+                break
+            pv = list(self.pv[0]) or result.pv
+            result = SearchResult(
+                pv[0],
+                score,
+                iteration,
+                pv,
+                self.nodes,
+                time.perf_counter() - started,
+                self.tt.probes,
+                self.tt.hits,
+            )
+            if info is not None:
+                info(result)
+            if abs(score) > MATE_BOUND and MATE_SCORE - abs(score) <= iteration:
+                break  # A mate has been found that no deeper search can improve
+        return result._replace(
+            nodes=self.nodes,
+            seconds=time.perf_counter() - started,
+            tt_probes=self.tt.probes,
+            tt_hits=self.tt.hits,
+        )
@@ -0,0 +1,185 @@
+"""
+Static evaluation: material plus piece-square tables, in centipawns.
+
+Tables are written from white's point of view with row 0 (black's back rank)
+first, the same layout as BoardState.board; black reads them mirrored.
+
+Bitboards keeps the sum of SQUARE_SCORES up to date as pieces are added and
+removed, like the Zobrist key, so evaluate() costs nothing. evaluate_batch()
+scores whole NumPy arrays of positions at once for offline work.
+"""
+
+import functools
+
+BATCH_ROWS = 1 << 16  # Positions scored per vectorized step, bounding memory
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)  # indexed by piece type
+
+# fmt: off
+PAWN_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_TABLE = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+)
+# fmt: on
+PIECE_SQUARE_TABLES = (
+    PAWN_TABLE,
+    KNIGHT_TABLE,
+    BISHOP_TABLE,
+    ROOK_TABLE,
+    QUEEN_TABLE,
+    KING_TABLE,
+)
+
+# SQUARE_SCORES[color][piece_type][square]: material plus table bonus, signed
+# so that white pieces count up and black pieces count down
+SQUARE_SCORES = (
+    [
+        [PIECE_VALUES[piece] + table[square] for square in range(64)]
+        for piece, table in enumerate(PIECE_SQUARE_TABLES)
+    ],
+    [
+        [-(PIECE_VALUES[piece] + table[square ^ 56]) for square in range(64)]
+        for piece, table in enumerate(PIECE_SQUARE_TABLES)
+    ],
+)
+
+
+# CODE_SCORES[code][square] for the mailbox codes of Bitboards.mailbox:
+# 0 for an empty square, else 1 + 6 * color + piece_type
+CODE_SCORES = [[0] * 64] + [
+    SQUARE_SCORES[color][piece_type] for color in (0, 1) for piece_type in range(6)
+]
+
+
+def evaluate(board):
+    """Score of the position for the side to move"""
+    score = board.bitboards.score
+    return score if board.white_to_move else -score
+
+
+def evaluate_placement(mailbox):
+    """White's score from a mailbox, added up square by square"""
+    return sum(CODE_SCORES[code][square] for square, code in enumerate(mailbox))
+
+
+###############
+# BATCHES
+###############
+
+
+@functools.lru_cache(maxsize=None)
+def _batch_weights():
+    import numpy as np
+
+    codes = np.array(CODE_SCORES, dtype=np.int32)  # (13, 64)
+    return codes, codes[1:].reshape(12 * 64)
+
+
+def mailbox_array(boards):
+    """An (N, 64) uint8 array of the boards' mailboxes, for evaluate_batch"""
+    import numpy as np
+
+    data = b"".join(bytes(board.bitboards.mailbox) for board in boards)
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 64)
+
+
+def planes_from_mailboxes(mailboxes):
+    """(N, 12, 64) 0/1 planes, plane 6 * color + piece_type, from (N, 64) codes"""
+    import numpy as np
+
+    mailboxes = np.asarray(mailboxes)
+    codes = np.arange(1, 13, dtype=mailboxes.dtype).reshape(1, 12, 1)
+    return (mailboxes[:, None, :] == codes).astype(np.uint8)
+
+
+def evaluate_batch(positions, white_to_move=None):
+    """
+    Scores of N positions in one vectorized pass, as an int32 array. positions
+    is either (N, 64) mailbox codes or (N, 12, 64) piece planes (see
+    planes_from_mailboxes). Scores are for white, or for the side to move
+    when white_to_move holds a flag per position.
+    """
+    import numpy as np
+
+    positions = np.asarray(positions)
+    codes, planes = _batch_weights()
+    if positions.ndim == 2 and positions.shape[1] == 64:
+        squares = np.arange(64)
+
+        def score(rows):
+            return codes[rows, squares].sum(axis=1, dtype=np.int32)
+
+    elif positions.ndim == 3 and positions.shape[1:] == (12, 64):
+
+        def score(rows):
+            return rows.reshape(len(rows), 12 * 64).astype(np.int32) @ planes
+
+    else:
+        raise ValueError(
+            f"expected an (N, 64) or (N, 12, 64) array, not {positions.shape}"
+        )
+
+    scores = np.empty(len(positions), dtype=np.int32)
+    for start in range(0, len(positions), BATCH_ROWS):
+        scores[start : start + BATCH_ROWS] = score(
+            positions[start : start + BATCH_ROWS]
+        )
+    if white_to_move is not None:
+        scores = np.where(np.asarray(white_to_move, dtype=bool), scores, -scores)
+    return scores
@@ -1,37 +1,78 @@
+import argparse
+import concurrent.futures
 import tkinter as tk
-from PIL import Image, ImageTk
-from board import BoardState
+from background import BackgroundTasks
+from board import BoardState, MAILBOX_PIECES
+from bitboard import square_position
+from moves import move_start, move_end, move_to_uci
+from pieces.pieces import Pawn
+from parallel import ParallelEngine
+from sprites import SpriteCache
+
+THINK_SECONDS = 5.0  # Engine time per move
+RESIZE_DELAY_MS = 150  # Quiet time after the last resize event before redrawing
+CLOSE_SECONDS = 3.0  # Longest wait for a stopped search when the window closes
+STATUS_HELP = "Space: engine move   Esc: stop thinking   R: new game"
 
 
 class ChessGUI:
-    def __init__(self):
+    def __init__(self, debug=False):
+        self.debug = debug  # Print the board after every move
         self.root = tk.Tk()
         self.board_state = BoardState()  # BoardState class manages the game state
         self.width = self.height = 1024
         # Floor division to make sure piece fits in square
         self.square_side = self.width // 8
         self.squares = {}
-        self.piece_images = {}  # Cache for loaded piece images
-        self.piece_img_locations = {}
+        self.piece_images = {}  # Piece images scaled to square_side
+        self.sprite_cache = SpriteCache()
+        self.sprite_size = None  # Square size piece_images were loaded for
+        self._resize_job = None  # Pending root.after call of _apply_resize
+        # Canvas image for each occupied square, and the mailbox it was drawn from
+        self.piece_sprites = {}
+        self.drawn_placement = bytes(64)
         self.cur_highlighted = None
         self.legal_move_circles = []
+        self.outlined_squares = []  # Squares outlined red as possible captures
         self.legal_moves = []
+        # The search runs in its own process so the window keeps its frame rate.
+        # Started before any threads are, since it forks.
+        self.engine = ParallelEngine(workers=1)
+        self._search_future = None
         self.init_ui()
 
     def init_ui(self):
         # All of this is involved with setting up the game
         self.root.title("Chess")
         self.canvas = tk.Canvas(self.root, width=self.width, height=self.height)
-        self.canvas.pack()
+        self.canvas.pack(fill="both", expand=True)
+        self.status = tk.Label(self.root, anchor="w", text=STATUS_HELP)
+        self.status.pack(fill="x")
         self.draw_board()
         self.load_piece_images()  # Caches the piece images
         self.setup_pieces()
+        # Legal moves and engine searches run here, off the Tk thread
+        self.tasks = BackgroundTasks(self.root)
 
         # This is involved with playing the game
         # Button-1 is left mouse, so left mouse selects a square containing a piece
         self.canvas.bind("<Button-1>", self.select_and_move_piece)
+        self.canvas.bind("<Configure>", self.resize_board)
+        self.root.bind("<space>", self.think)
+        self.root.bind("<Escape>", self.stop_thinking)
+        self.root.bind("r", self.reset_game)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.root.mainloop()
 
+    def close(self):
+        self.tasks.close()
+        self.engine.stop()
+        # The search must see its result come back before the pool is killed
+        if self._search_future is not None:
+            concurrent.futures.wait([self._search_future], timeout=CLOSE_SECONDS)
+        self.engine.close()
+        self.root.destroy()
+
     ###############
     # DEBUGGING
     ###############
@@ -56,13 +97,14 @@ class ChessGUI:
 
     ### Draw the board ###
 
-    def _draw_square(self, row, col, color):
+    def _square_bounds(self, row, col):
         x1 = col * self.square_side
         y1 = row * self.square_side
-        x2 = x1 + self.square_side
-        y2 = y1 + self.square_side
+        return x1, y1, x1 + self.square_side, y1 + self.square_side
+
+    def _draw_square(self, row, col, color):
         square = self.canvas.create_rectangle(
-            x1, y1, x2, y2, fill=color, outline="black", width=1
+            *self._square_bounds(row, col), fill=color, outline="black", width=1
         )
         self.squares[(row, col)] = square
 
@@ -76,26 +118,46 @@ class ChessGUI:
 
     ### Load piece images ###
 
-    def _resize_image(self, img):
-        img_resized = img.resize(
-            (round(self.width / 8), round(self.height / 8)), Image.ANTIALIAS
-        )
-        img_tk = ImageTk.PhotoImage(img_resized)
-        return img_tk
-
-    def _load_image(self, color, piece):
-        img_path = f"piece_images/{color}-{piece}.png"
-        img = Image.open(img_path).convert("RGBA")
-        img_tk = self._resize_image(img)
-        self.piece_images[f"{color}-{piece}"] = img_tk
-
     def load_piece_images(self):
-        """Preloads images so that we only have to do this once"""
+        """
+        Loads the piece images at the current square size. They come from the
+        sprite cache, so only a new size needs any scaling.
+        """
+        if self.sprite_size == self.square_side:
+            return
         pieces = ["rook", "knight", "bishop", "queen", "king", "pawn"]
         colors = ["black", "white"]
         for piece in pieces:
             for color in colors:
-                self._load_image(color, piece)
+                name = f"{color}-{piece}"
+                path = self.sprite_cache.path(name, self.square_side)
+                self.piece_images[name] = tk.PhotoImage(file=path)
+        self.sprite_size = self.square_side
+
+    def resize_board(self, event):
+        """
+        Fit the board to the canvas when the window is resized. Dragging the
+        window edge sends a stream of events, so the board is only redrawn
+        once they have paused for RESIZE_DELAY_MS.
+        """
+        if self._resize_job is not None:
+            self.root.after_cancel(self._resize_job)
+        side = min(event.width, event.height) // 8
+        self._resize_job = self.root.after(RESIZE_DELAY_MS, self._apply_resize, side)
+
+    def _apply_resize(self, side):
+        self._resize_job = None
+        if side < 1 or side == self.square_side:
+            return
+        self.square_side = side
+        self._reset_hightlight()
+        for (row, col), square in self.squares.items():
+            self.canvas.coords(square, *self._square_bounds(row, col))
+        self.load_piece_images()
+        for square, sprite in self.piece_sprites.items():
+            piece = MAILBOX_PIECES[self.drawn_placement[square]]
+            self.canvas.coords(sprite, *self._square_center(square))
+            self.canvas.itemconfig(sprite, image=self._get_piece_image(piece))
 
     ### Visually moving (placing and deleting) pieces ###
 
@@ -105,29 +167,53 @@ class ChessGUI:
         color = "black" if piece.color == "b" else "white"
         return self.piece_images[f"{color}-{piece_type}"]
 
-    def _draw_piece(self, img, row, col):
-        """Helper to draw piece on the board using preloaded image from dict"""
-        x = (col * self.square_side) + self.square_side / 2
-        y = (row * self.square_side) + self.square_side / 2
-        visual_piece = self.canvas.create_image(x, y, image=img)
-        self.piece_img_locations[f"{row}{col}"] = visual_piece
-
-    def _delete_piece(self, row, col):
-        piece_to_delete = self.piece_img_locations[f"{row}{col}"]
-        self.canvas.delete(piece_to_delete)
+    def _square_center(self, square):
+        row, col = divmod(square, 8)
+        return (
+            (col * self.square_side) + self.square_side / 2,
+            (row * self.square_side) + self.square_side / 2,
+        )
 
-    def _place_piece(self, row, col):
-        """This is the connection between the "back-end" and "front-end" setup"""
-        piece = self.board_state.board[row][col]
-        if piece is not None:
-            img = self._get_piece_image(piece)
-            self._draw_piece(img, row, col)
+    def sync_pieces(self):
+        """
+        Bring the sprites in line with the board, touching only the squares
+        whose contents changed since the last sync. A piece that moved keeps
+        its sprite, which is shifted with canvas.coords; sprites are only
+        created for promotions or a new game and deleted for captures.
+        """
+        placement = bytes(self.board_state.bitboards.mailbox)
+        changed = [
+            square
+            for square in range(64)
+            if placement[square] != self.drawn_placement[square]
+        ]
+        vacated = {}  # Mailbox code -> sprites lifted off changed squares
+        for square in changed:
+            sprite = self.piece_sprites.pop(square, None)
+            if sprite is not None:
+                code = self.drawn_placement[square]
+                vacated.setdefault(code, []).append(sprite)
+        for square in changed:
+            code = placement[square]
+            if not code:
+                continue
+            if vacated.get(code):
+                sprite = vacated[code].pop()
+                self.canvas.coords(sprite, *self._square_center(square))
+            else:
+                image = self._get_piece_image(MAILBOX_PIECES[code])
+                sprite = self.canvas.create_image(
+                    *self._square_center(square), image=image
+                )
+            self.piece_sprites[square] = sprite
+        for sprites in vacated.values():
+            for sprite in sprites:
+                self.canvas.delete(sprite)
+        self.drawn_placement = placement
 
     def setup_pieces(self):
         """Places pieces on the board"""
-        for row in range(8):
-            for col in range(8):
-                self._place_piece(row, col)
+        self.sync_pieces()
 
     ###############
     # HIGHLIGHTING
@@ -137,12 +223,15 @@ class ChessGUI:
 
     def _highlight_potential_capture(self, square):
         row, col = square
-        if (
-            self.board_state.board[row][col] is not None
-            or square in self.board_state.en_passant_squares
+        start_row, start_col = self.cur_highlighted
+        piece = self.board_state.board[start_row][start_col]
+        # A pawn that changes file always captures, en passant included
+        if self.board_state.board[row][col] is not None or (
+            isinstance(piece, Pawn) and col != start_col
         ):
             capture_square = self.squares.get((row, col))
             self.canvas.itemconfig(capture_square, outline="red", width=3)
+            self.outlined_squares.append(capture_square)
 
     def _highlight_potential_move(self, square):
         row, col = square
@@ -172,9 +261,10 @@ class ChessGUI:
         self.legal_move_circles = []
 
     def _reset_capture_highlight(self):
-        for tup in self.squares:
-            square = self.squares.get((tup))
+        """Only the squares that were outlined need resetting"""
+        for square in self.outlined_squares:
             self.canvas.itemconfig(square, outline="black", width=1)
+        self.outlined_squares = []
 
     def _deselect_piece(self):
         """Deselect a piece by changing the color back to original state"""
@@ -196,46 +286,23 @@ class ChessGUI:
     # GAME INPUTS
     ###############
 
-    def _is_capture(self, start, end):
-        captor = self.board_state.board[start[0]][start[1]]
-        captee = self.board_state.board[end[0]][end[1]]
-        if captor is not None and captee is not None and captor.color != captee.color:
-            return True
-        return False
-
-    def _handle_capture(self, start, end):
-        if self._is_capture(start, end):
-            self._delete_piece(end[0], end[1])
-            self.board_state.capture_piece(end)
-
-    def _handle_en_passant(self, end):
-        if end in self.board_state.en_passant_squares:
-            # Update end to the correct pawn position just for deletion
-            direction = 1 if self.board_state.white_to_move else -1
-            ep_end_row = end[0] + (1 * direction)
-            self._delete_piece(ep_end_row, end[1])
-            self.board_state.capture_piece((ep_end_row, end[1]))
-
-    def _handle_castle(self, end):
-        if self.board_state.castled_rook_position is not None:
-            rook_position = self.board_state.castled_rook_position
-            self._delete_piece(rook_position[0], rook_position[1])
-            rook_end_col = 5 if end[1] == 6 else 3
-            self._place_piece(end[0], rook_end_col)
-            self.board_state.castled_rook_position = None
-
     def _make_move(self, start, end):
-        # Handle special cases
-        self._handle_en_passant(end)
-        self._handle_capture(start, end)
-        # Move the piece
+        # Whatever was being worked out was for the position before this move
+        self.tasks.cancel("moves")
+        self.stop_thinking()
+        # Captures, en passant and castling are all played out by the board
         self.board_state.move_piece(start, end)
-        self._handle_castle(end)  # Relies on move_piece updating game state
-        self._delete_piece(start[0], start[1])
-        self._place_piece(end[0], end[1])
+        self.sync_pieces()
         # Restart for next move
         self._reset_hightlight()
-        self.print_debug_board()
+        if self.debug:
+            self.print_debug_board()
+        self._show_outcome()
+
+    def _show_outcome(self):
+        outcome = self.board_state.outcome()
+        if outcome is not None:
+            self.root.title(f"Chess - {outcome.result} ({outcome.termination})")
 
     def _get_selected_square(self, event):
         row = event.y // self.square_side
@@ -249,12 +316,42 @@ class ChessGUI:
         self._deselect_piece()
         self._reset_hightlight()
         # Select the new square
-        selected_square = self.squares.get((row_selected, col_selected))
-        self.canvas.itemconfig(selected_square, fill="#90EE90")
+        self.canvas.itemconfig(
+            self.squares.get((row_selected, col_selected)), fill="#90EE90"
+        )
         self.cur_highlighted = (row_selected, col_selected)
-        # Highlight legal moves
-        self.legal_moves = self.board_state.filter_legal_moves_for_check(selected_piece)
-        self._highlight_legal_moves(self.legal_moves)
+        self.legal_moves = []
+        board = self.board_state
+        if board.zobrist_key in board.move_cache:
+            # Answered from the move cache, which is quick enough for the Tk thread
+            self._show_legal_moves(board.filter_legal_moves_for_check(selected_square))
+            return
+        # Otherwise found in the background, on a copy since the live board may
+        # be moved on while the worker reads it
+        snapshot = BoardState.from_bytes(board.to_bytes())
+        self.tasks.submit(
+            "moves",
+            self._find_legal_moves,
+            snapshot,
+            (row_selected, col_selected),
+            on_done=self._cache_legal_moves,
+        )
+
+    @staticmethod
+    def _find_legal_moves(snapshot, square):
+        """Runs on a worker thread, on a board no other thread touches"""
+        squares = snapshot.filter_legal_moves_for_check(square)
+        return snapshot.zobrist_key, snapshot.legal_moves(), squares
+
+    def _cache_legal_moves(self, found):
+        # The live board's cache is only ever touched from the Tk thread
+        key, moves, squares = found
+        self.board_state.move_cache.put(key, moves)
+        self._show_legal_moves(squares)
+
+    def _show_legal_moves(self, legal_moves):
+        self.legal_moves = legal_moves
+        self._highlight_legal_moves(legal_moves)
 
     def select_and_move_piece(self, event):
         """Highlights a piece before moving it."""
@@ -272,6 +369,64 @@ class ChessGUI:
         else:
             return None
 
+    ###############
+    # ENGINE
+    ###############
+
+    def think(self, event=None):
+        """Let the engine pick a move for the side to move, in the background"""
+        if self._search_future is not None and not self._search_future.done():
+            return  # Still searching, or a cancelled search is still winding down
+        if self.board_state.outcome() is not None:
+            return
+        snapshot = BoardState.from_bytes(self.board_state.to_bytes())
+        self.status.config(text="Thinking...")
+        self._search_future = self.tasks.submit(
+            "engine",
+            self._search,
+            snapshot,
+            on_progress=self._show_search_progress,
+            on_done=self._play_engine_move,
+            on_cancel=self.engine.stop,
+        )
+
+    def _search(self, board, report):
+        return self.engine.search(board, movetime=THINK_SECONDS, info=report)
+
+    def stop_thinking(self, event=None):
+        if self.tasks.busy("engine"):
+            self.tasks.cancel("engine")
+            self.status.config(text=STATUS_HELP)
+
+    def _show_search_progress(self, result):
+        self.status.config(
+            text=f"Thinking...  depth {result.depth}  {result.nps:,} nps  "
+            f"score {result.score / 100:+.2f}  best {move_to_uci(result.best_move)}"
+        )
+
+    def _play_engine_move(self, result):
+        self.status.config(text=STATUS_HELP)
+        if result.best_move is None:
+            return
+        start = square_position(move_start(result.best_move))
+        end = square_position(move_end(result.best_move))
+        self._reset_hightlight()
+        self._make_move(start, end)
+
+    def reset_game(self, event=None):
+        self.tasks.cancel("moves")
+        self.stop_thinking()
+        self._reset_hightlight()
+        self.legal_moves = []
+        self.board_state = BoardState()
+        self.sync_pieces()
+        self.root.title("Chess")
+        self.engine.new_game()
+
 
 if __name__ == "__main__":
-    gui = ChessGUI()
+    parser = argparse.ArgumentParser(description="Play chess")
+    parser.add_argument(
+        "--debug", action="store_true", help="print the board after every move"
+    )
+    gui = ChessGUI(debug=parser.parse_args().debug)
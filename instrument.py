@@ -0,0 +1,143 @@
+"""
+Opt-in call counts and timings for BoardState's hot paths.
+
+Nothing is measured, and nothing costs anything, outside an instrument()
+block: the methods are only wrapped while it is open and the originals are
+put back when it closes.
+
+    with instrument() as stats:
+        engine.search(board, depth=5)
+    print(stats.report())
+    stats.dump("search-stats.json")
+
+Only calls in this process are seen; worker processes of a pool started
+outside the block run the plain methods.
+"""
+
+import contextlib
+import functools
+import inspect
+import json
+import threading
+import time
+
+from board import BoardState
+
+# The move generator itself (iter_legal_moves) is a generator, and a wrapper
+# would only time creating it, so it is timed through generate_legal_moves
+DEFAULT_METHODS = (
+    "filter_legal_moves_for_check",
+    "legal_moves",
+    "generate_legal_moves",
+    "_get_pins",
+    "any_legal_move",
+    "make_move",
+    "unmake_move",
+    "gives_check",
+    "outcome",
+)
+
+_lock = threading.Lock()
+_active = False  # Only one block at a time, so wrappers never stack
+
+
+class FunctionStats:
+    __slots__ = ("calls", "seconds", "own_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0  # Including the instrumented methods it called
+        self.own_seconds = 0.0  # Excluding them
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "own_seconds": self.own_seconds,
+        }
+
+
+class Stats:
+    def __init__(self, names):
+        self.functions = {name: FunctionStats() for name in names}
+        self.seconds = 0.0  # Wall time of the whole block
+
+    def __getitem__(self, name):
+        return self.functions[name]
+
+    def as_dict(self):
+        return {
+            "seconds": self.seconds,
+            "functions": {
+                name: record.as_dict() for name, record in self.functions.items()
+            },
+        }
+
+    def dump(self, path):
+        with open(path, "w") as stream:
+            json.dump(self.as_dict(), stream, indent=2)
+
+    def report(self):
+        """A table of the called methods, most total time first"""
+        lines = [
+            f"{'method':<30} {'calls':>10} {'total s':>9} {'own s':>9} {'us/call':>9}"
+        ]
+        called = [item for item in self.functions.items() if item[1].calls]
+        for name, record in sorted(called, key=lambda item: -item[1].seconds):
+            lines.append(
+                f"{name:<30} {record.calls:>10} {record.seconds:>9.3f} "
+                f"{record.own_seconds:>9.3f} "
+                f"{record.seconds / record.calls * 1e6:>9.1f}"
+            )
+        lines.append(f"{'wall time':<30} {'':>10} {self.seconds:>9.3f}")
+        return "\n".join(lines)
+
+
+def _timed(function, record, local):
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        # Time spent in instrumented callees, per thread, so own time excludes it
+        stack = local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            record.calls += 1
+            record.seconds += elapsed
+            record.own_seconds += elapsed - stack.pop()
+            if stack:
+                stack[-1] += elapsed
+
+    return timed
+
+
+@contextlib.contextmanager
+def instrument(methods=DEFAULT_METHODS, cls=BoardState):
+    """Count and time calls to cls's methods (by name) inside the block"""
+    global _active
+    with _lock:
+        if _active:
+            raise RuntimeError("instrumentation is already running")
+        _active = True
+    stats = Stats(methods)
+    local = threading.local()
+    originals = {}
+    try:
+        for name in methods:
+            original = cls.__dict__.get(name)
+            if not callable(original) or inspect.isgeneratorfunction(original):
+                raise TypeError(f"{cls.__name__}.{name} is not a plain method")
+            originals[name] = original
+            setattr(cls, name, _timed(original, stats.functions[name], local))
+        started = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds = time.perf_counter() - started
+    finally:
+        for name, original in originals.items():
+            setattr(cls, name, original)
+        with _lock:
+            _active = False
@@ -0,0 +1,45 @@
+"""
+Moves are packed into a single int: start square in bits 0-5, end square in
+bits 6-11 and the promotion piece type (0 for none) in bits 12-14.
+Squares use the bitboard numbering, ``row * 8 + col``.
+"""
+
+
+def encode_move(start, end, promotion=0):
+    return start | (end << 6) | (promotion << 12)
+
+
+def move_start(move):
+    return move & 63
+
+
+def move_end(move):
+    return (move >> 6) & 63
+
+
+def move_promotion(move):
+    return move >> 12
+
+
+def square_name(square):
+    row, col = divmod(square, 8)
+    return "abcdefgh"[col] + str(8 - row)
+
+
+def parse_square(name):
+    return (8 - int(name[1])) * 8 + "abcdefgh".index(name[0])
+
+
+def move_to_uci(move):
+    """Long algebraic notation as used by UCI, e.g. e2e4 or e7e8q"""
+    promotion = move_promotion(move)
+    return (
+        square_name(move_start(move))
+        + square_name(move_end(move))
+        + ("" if not promotion else " nbrq"[promotion])
+    )
+
+
+def move_from_uci(text):
+    promotion = " nbrq".index(text[4]) if len(text) > 4 else 0
+    return encode_move(parse_square(text[:2]), parse_square(text[2:4]), promotion)
@@ -0,0 +1,177 @@
+"""
+Lazy SMP search: several worker processes search the same position at once
+and share one transposition table in shared memory, so each picks up the
+results the others store. The main worker's budget decides when the search
+ends, then the helpers are stopped. Positions are sent to the workers with
+BoardState.to_bytes().
+
+    with ParallelEngine(workers=8, hash_mb=64) as engine:
+        result = engine.search(board, movetime=5.0)
+
+    python parallel.py --workers 1,2,4,8 --movetime 5   # depth reached per worker count
+    python parallel.py --workers 1,2,4,8 --depth 6      # time to depth per worker count
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+
+from board import BoardState
+from engine import Engine, TranspositionTable
+from moves import move_to_uci
+
+INFO_POLL_SECONDS = 0.05
+# How long search waits for the workers to finish once it has been stopped
+STOP_GRACE_SECONDS = 2.0
+
+# Set in each worker process by _init_worker
+_engine = None
+_info_queue = None
+
+
+def _init_worker(table, stop_event, info_queue):
+    global _engine, _info_queue
+    _engine = Engine(tt=TranspositionTable(buffer=table), stop_event=stop_event)
+    _info_queue = info_queue
+
+
+def _search_worker(position, worker, limits):
+    board = BoardState.from_bytes(position)
+    if worker == 0:
+        result = _engine.search(board, info=_info_queue.put, **limits)
+        _info_queue.put(None)  # Tells the parent that no more updates follow
+        return result
+    # Every other helper starts a ply deeper so they do not all walk the
+    # same tree in lockstep
+    return _engine.search(board, min_depth=1 + worker % 2, **limits)
+
+
+class ParallelEngine:
+    def __init__(self, workers=None, hash_mb=16):
+        self.workers = workers or os.cpu_count() or 1
+        context = multiprocessing.get_context()
+        self._table = context.RawArray("B", TranspositionTable.buffer_size(hash_mb))
+        self.tt = TranspositionTable(buffer=self._table)
+        self.stop_event = context.Event()
+        self._info_queue = context.Queue()
+        self._pool = context.Pool(
+            self.workers,
+            _init_worker,
+            (self._table, self.stop_event, self._info_queue),
+        )
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Kill the workers; a search still waiting on them raises RuntimeError"""
+        self._closed = True
+        self.stop_event.set()
+        self._pool.terminate()
+        self._pool.join()
+
+    def stop(self):
+        """Ask a running search to return as soon as possible"""
+        self.stop_event.set()
+
+    def new_game(self):
+        self.tt.clear()
+
+    def search(self, board, depth=None, nodes=None, movetime=None, info=None):
+        """
+        Same limits and result as Engine.search. The node limit applies to
+        the main worker; the result's nodes and table statistics add up all
+        workers, and its move comes from the deepest completed search.
+        """
+        started = time.perf_counter()
+        self.stop_event.clear()
+        position = board.to_bytes()
+        main = self._pool.apply_async(
+            _search_worker,
+            (position, 0, dict(depth=depth, nodes=nodes, movetime=movetime)),
+        )
+        helpers = [
+            self._pool.apply_async(
+                _search_worker, (position, worker, dict(depth=depth, movetime=movetime))
+            )
+            for worker in range(1, self.workers)
+        ]
+        stopped_at = None
+        while True:
+            try:
+                update = self._info_queue.get(timeout=INFO_POLL_SECONDS)
+            except queue.Empty:
+                if main.ready() and not main.successful():
+                    main.get()  # Re-raises the worker's exception
+                # Once stopped or closed the workers get a bounded time to
+                # answer; a terminated pool never will
+                if stopped_at is None and (self._closed or self.stop_event.is_set()):
+                    stopped_at = time.perf_counter()
+                if (
+                    stopped_at is not None
+                    and time.perf_counter() - stopped_at > STOP_GRACE_SECONDS
+                ):
+                    if main.ready():
+                        break
+                    raise RuntimeError("the search workers did not stop")
+                continue
+            if update is None:
+                break
+            if info is not None:
+                info(update)
+        main_result = main.get()
+        self.stop_event.set()
+        results = [main_result]
+        for helper in helpers:
+            try:
+                results.append(helper.get(timeout=STOP_GRACE_SECONDS))
+            except multiprocessing.TimeoutError:
+                pass  # Its depth and nodes are left out
+        self.stop_event.clear()
+
+        best = max(results, key=lambda result: result.depth)
+        return best._replace(
+            nodes=sum(result.nodes for result in results),
+            seconds=time.perf_counter() - started,
+            tt_probes=sum(result.tt_probes for result in results),
+            tt_hits=sum(result.tt_hits for result in results),
+        )
+
+
+###############
+# BENCHMARK
+###############
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Lazy SMP scaling")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated counts")
+    parser.add_argument("--movetime", type=float, default=5.0, help="seconds")
+    parser.add_argument("--depth", type=int, help="search to this depth instead")
+    parser.add_argument("--hash", type=int, default=64, help="table size in MB")
+    args = parser.parse_args(argv)
+
+    board = BoardState()
+    for workers in (int(count) for count in args.workers.split(",")):
+        with ParallelEngine(workers, args.hash) as engine:
+            if args.depth:
+                result = engine.search(board, depth=args.depth)
+            else:
+                result = engine.search(board, movetime=args.movetime)
+        print(
+            f"workers {workers:>3}  depth {result.depth:>2}  "
+            f"time {result.seconds:7.2f}s  "
+            f"nodes {result.nodes:>9}  nps {result.nps:>8}  "
+            f"tt hits {result.tt_hit_rate:6.1%}  "
+            f"best {move_to_uci(result.best_move)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+Known counts for the standard reference positions make this both a
+correctness gate for move generation and a benchmark for it.
+
+    python perft.py 4                      # start position, depth 4
+    python perft.py 3 --fen "<fen>" --divide
+    python perft.py --suite                # every reference position
+"""
+
+import argparse
+import time
+
+from board import BoardState
+from moves import move_to_uci
+
+# name: (fen, node counts for depth 1, 2, ...)
+# Counts are from https://www.chessprogramming.org/Perft_Results
+REFERENCE_POSITIONS = {
+    "startpos": (
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609],
+    ),
+    "kiwipete": (
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603],
+    ),
+    "position3": (
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624],
+    ),
+    "position4": (
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333],
+    ),
+    "position5": (
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487],
+    ),
+    "position6": (
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594],
+    ),
+}
+
+
+###############
+# COUNTING
+###############
+
+
+def perft(board, depth):
+    """Number of leaf nodes depth plies below the current position"""
+    moves = board.generate_legal_moves()
+    if depth <= 1:
+        # Bulk counting: the leaves do not need to be played
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board, depth):
+    """Leaf counts below each root move, keyed by the move in UCI notation"""
+    counts = {}
+    for move in board.generate_legal_moves():
+        board.make_move(move)
+        counts[move_to_uci(move)] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def timed_perft(board, depth):
+    """Returns (nodes, seconds)"""
+    start = time.perf_counter()
+    nodes = perft(board, depth)
+    return nodes, time.perf_counter() - start
+
+
+###############
+# CLI
+###############
+
+
+def _report(name, depth, nodes, seconds, expected=None):
+    status = ""
+    if expected is not None:
+        status = "ok" if nodes == expected else f"FAIL (expected {expected})"
+    nps = nodes / seconds if seconds else 0
+    print(
+        f"{name:<10} depth {depth}  {nodes:>10} nodes  {seconds:8.3f}s  "
+        f"{nps:>10.0f} nps  {status}"
+    )
+
+
+def run_suite(max_depth):
+    """Run every reference position up to max_depth; returns True if all match"""
+    passed = True
+    for name, (fen, counts) in REFERENCE_POSITIONS.items():
+        for depth, expected in enumerate(counts[:max_depth], start=1):
+            nodes, seconds = timed_perft(BoardState.from_fen(fen), depth)
+            _report(name, depth, nodes, seconds, expected)
+            passed = passed and nodes == expected
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generation leaf nodes")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--fen", help="position to start from (default: start)")
+    parser.add_argument(
+        "--divide", action="store_true", help="print counts per root move"
+    )
+    parser.add_argument(
+        "--suite", action="store_true", help="check all reference positions"
+    )
+    parser.add_argument(
+        "--profile", metavar="JSON", nargs="?", const="",
+        help="print per-method call counts and times, and save them to JSON",
+    )  # fmt: skip
+    args = parser.parse_args(argv)
+
+    if args.profile is not None:
+        from instrument import instrument
+
+        with instrument() as stats:
+            status = _run(args)
+        print(stats.report())
+        if args.profile:
+            stats.dump(args.profile)
+        return status
+    return _run(args)
+
+
+def _run(args):
+    if args.suite:
+        return 0 if run_suite(args.depth) else 1
+
+    fen = args.fen or REFERENCE_POSITIONS["startpos"][0]
+    board = BoardState.from_fen(fen)
+    if args.divide:
+        start = time.perf_counter()
+        counts = divide(board, args.depth)
+        for move, nodes in sorted(counts.items()):
+            print(f"{move}: {nodes}")
+        print(f"\nMoves: {len(counts)}")
+        nodes, seconds = sum(counts.values()), time.perf_counter() - start
+    else:
+        nodes, seconds = timed_perft(board, args.depth)
+    _report("perft", args.depth, nodes, seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
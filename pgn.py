@@ -0,0 +1,354 @@
+"""
+Portable Game Notation: a streaming game reader, standard algebraic notation
+(SAN) in both directions, and replay of games through BoardState's rules.
+
+Games are read lazily, one at a time, so archives of any size can be
+validated without loading them into memory:
+
+    with open("games.pgn") as stream:
+        for game in read_games(stream):
+            board = replay(game)
+
+    python pgn.py games.pgn --workers 8    # replay every game, report games/sec
+    zcat games.pgn.gz | python pgn.py -    # read from stdin
+"""
+
+import argparse
+import collections
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+import time
+from typing import NamedTuple
+
+from board import BoardState
+from bitboard import WHITE, BLACK, PAWN, KING
+from moves import move_start, move_end, move_promotion, parse_square, square_name
+
+SAN_PIECES = "PNBRQK"  # indexed by piece type; pawns are written without a letter
+SAN_PATTERN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?")
+CASTLING_SAN = {"O-O": True, "0-0": True, "O-O-O": False, "0-0-0": False}
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>\{[^}]*\}?|;[^\n]*)
+    | (?P<nag>\$\d+)
+    | (?P<open>\()
+    | (?P<close>\))
+    | (?P<result>1-0|0-1|1/2-1/2|\*)
+    | (?P<number>\d+\.+)
+    | (?P<move>[A-Za-z0-9][A-Za-z0-9=+#\-]*[!?]*)
+    """,
+    re.VERBOSE,
+)
+
+
+class IllegalMoveError(ValueError):
+    pass
+
+
+###############
+# SAN
+###############
+
+
+def move_from_san(board, san):
+    """Encoded move for san in board's position; raises IllegalMoveError"""
+    text = san.rstrip("+#!?")
+    pieces = board.bitboards.pieces[WHITE if board.white_to_move else BLACK]
+    if text in CASTLING_SAN:
+        step = 2 if CASTLING_SAN[text] else -2
+        for move in board.generate_legal_moves(from_mask=pieces[KING]):
+            if move_end(move) - move_start(move) == step:
+                return move
+        raise IllegalMoveError(f"{san} is not legal")
+
+    match = SAN_PATTERN.fullmatch(text)
+    if match is None:
+        raise IllegalMoveError(f"{san!r} is not a SAN move")
+    piece, file, rank, square, promotion = match.groups()
+    piece_type = SAN_PIECES.index(piece) if piece else PAWN
+    end = parse_square(square)
+    promotion = SAN_PIECES.index(promotion) if promotion else 0
+    candidates = [
+        move
+        for move in board.generate_legal_moves(from_mask=pieces[piece_type])
+        if move_end(move) == end
+        and move_promotion(move) == promotion
+        and (file is None or square_name(move_start(move))[0] == file)
+        and (rank is None or square_name(move_start(move))[1] == rank)
+    ]
+    if len(candidates) != 1:
+        reason = "is ambiguous" if candidates else "is not legal"
+        raise IllegalMoveError(f"{san} {reason}")
+    return candidates[0]
+
+
+def move_to_san(board, move):
+    """SAN for a legal move in board's position, e.g. Nbd7, exd6, e8=Q+ or O-O"""
+    start, end, promotion = move_start(move), move_end(move), move_promotion(move)
+    color = WHITE if board.white_to_move else BLACK
+    bitboards = board.bitboards
+    piece_type = bitboards.piece_type_at(start, color)
+
+    if piece_type == KING and abs(end - start) == 2:
+        san = "O-O" if end > start else "O-O-O"
+    elif piece_type == PAWN:
+        san = ""
+        if start % 8 != end % 8:  # Pawns only change file when capturing
+            san = square_name(start)[0] + "x"
+        san += square_name(end)
+        if promotion:
+            san += "=" + SAN_PIECES[promotion]
+    else:
+        san = SAN_PIECES[piece_type]
+        others = [
+            move_start(other)
+            for other in board.generate_legal_moves(
+                from_mask=bitboards.pieces[color][piece_type] & ~(1 << start)
+            )
+            if move_end(other) == end
+        ]
+        if others:
+            if all(other % 8 != start % 8 for other in others):
+                san += square_name(start)[0]
+            elif all(other // 8 != start // 8 for other in others):
+                san += square_name(start)[1]
+            else:
+                san += square_name(start)
+        if bitboards.occupied >> end & 1:
+            san += "x"
+        san += square_name(end)
+
+    board.make_move(move)
+    if board.in_check():
+        san += "+" if board.generate_legal_moves() else "#"
+    board.unmake_move()
+    return san
+
+
+###############
+# READING
+###############
+
+
+class Game(NamedTuple):
+    headers: dict
+    moves: list  # SAN of the main line
+    result: str
+
+
+def _ends_in_comment(line, in_comment):
+    """Whether a {comment} is still open after line"""
+    opened, closed = line.rfind("{"), line.rfind("}")
+    if opened > closed:
+        return True
+    if closed >= 0:
+        return False
+    return in_comment
+
+
+def parse_movetext(movetext):
+    """(SAN moves of the main line, result) skipping comments, NAGs and variations"""
+    moves, result, variation_depth = [], "*", 0
+    for match in TOKEN_PATTERN.finditer(movetext):
+        kind = match.lastgroup
+        if kind == "open":
+            variation_depth += 1
+        elif kind == "close":
+            variation_depth = max(variation_depth - 1, 0)
+        elif variation_depth:
+            continue
+        elif kind == "move":
+            moves.append(match.group())
+        elif kind == "result":
+            result = match.group()
+    return moves, result
+
+
+def _make_game(headers, movetext_lines):
+    moves, result = parse_movetext("\n".join(movetext_lines))
+    if result == "*":
+        result = headers.get("Result", "*")
+    return Game(headers, moves, result)
+
+
+def read_games(stream):
+    """
+    Yield the games in a PGN text stream one at a time. Only the game being
+    read is held in memory.
+    """
+    headers, movetext, in_comment = {}, [], False
+    for line in stream:
+        line = line.strip()
+        if not in_comment:
+            if not line or line.startswith("%"):
+                continue
+            if line.startswith("["):
+                if movetext:
+                    yield _make_game(headers, movetext)
+                    headers, movetext = {}, []
+                match = TAG_PATTERN.match(line)
+                if match:
+                    headers[match[1]] = re.sub(r"\\(.)", r"\1", match[2])
+                continue
+        movetext.append(line)
+        in_comment = _ends_in_comment(line, in_comment)
+    if headers or movetext:
+        yield _make_game(headers, movetext)
+
+
+###############
+# WRITING
+###############
+
+LINE_LENGTH = 79
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def format_game(game):
+    """
+    PGN text for a Game, headers in the order given, movetext wrapped to
+    LINE_LENGTH. Move numbers follow the FEN header when there is one.
+    """
+    lines = [f'[{name} "{_escape(value)}"]' for name, value in game.headers.items()]
+    fen = game.headers.get("FEN")
+    board = BoardState.from_fen(fen) if fen else BoardState()
+    number, white_to_move = board.fullmove_number, board.white_to_move
+    tokens = []
+    for index, san in enumerate(game.moves):
+        if white_to_move:
+            tokens.append(f"{number}.")
+        elif index == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(game.result)
+
+    movetext, line = [], ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            movetext.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    movetext.append(line)
+    return "\n".join(lines + [""] + movetext) + "\n"
+
+
+###############
+# REPLAY
+###############
+
+
+def replay(game):
+    """
+    Play every move of game from its start position (the FEN tag, if any)
+    and return the final board. Raises IllegalMoveError naming the move.
+    """
+    fen = game.headers.get("FEN")
+    board = BoardState.from_fen(fen) if fen else BoardState()
+    for san in game.moves:
+        number = board.fullmove_number
+        dots = "." if board.white_to_move else "..."
+        try:
+            board.make_move(move_from_san(board, san))
+        except IllegalMoveError as error:
+            raise IllegalMoveError(f"{number}{dots} {error}") from None
+    return board
+
+
+class ValidationReport(NamedTuple):
+    games: int
+    plies: int
+    errors: list  # (game number counting from 1, message)
+    seconds: float
+
+    @property
+    def games_per_second(self):
+        return self.games / self.seconds if self.seconds else 0.0
+
+
+def _validate_chunk(first_number, games):
+    """(plies replayed, errors) for a run of games numbered from first_number"""
+    plies, errors = 0, []
+    for number, game in enumerate(games, start=first_number):
+        try:
+            plies += len(replay(game).move_log)
+        except ValueError as error:  # IllegalMoveError or a bad FEN tag
+            errors.append((number, str(error)))
+    return plies, errors
+
+
+def validate_games(games, workers=None, chunk_size=64):
+    """
+    Replay every game from an iterable (such as read_games) and collect the
+    ones that fail. With more than one worker the games are replayed by a
+    process pool in chunks; only a few chunks per worker are in flight at
+    once so a stream is never read far ahead of the replay.
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    games = iter(games)
+    chunks = iter(lambda: list(itertools.islice(games, chunk_size)), [])
+    total = plies = 0
+    errors = []
+
+    def collect(chunk_plies, chunk_errors):
+        nonlocal plies
+        plies += chunk_plies
+        errors.extend(chunk_errors)
+
+    if workers == 1:
+        for chunk in chunks:
+            collect(*_validate_chunk(total + 1, chunk))
+            total += len(chunk)
+    else:
+        with multiprocessing.get_context().Pool(workers) as pool:
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_validate_chunk, (total + 1, chunk)))
+                total += len(chunk)
+                if len(pending) >= 2 * workers:
+                    collect(*pending.popleft().get())
+            while pending:
+                collect(*pending.popleft().get())
+    errors.sort()
+    return ValidationReport(total, plies, errors, time.perf_counter() - started)
+
+
+###############
+# CLI
+###############
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay and validate PGN games")
+    parser.add_argument("path", help="PGN file, or - for stdin")
+    parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    if args.path == "-":
+        report = validate_games(read_games(sys.stdin), args.workers)
+    else:
+        with open(args.path, encoding="utf-8", errors="replace") as stream:
+            report = validate_games(read_games(stream), args.workers)
+    for number, message in report.errors:
+        print(f"game {number}: {message}")
+    print(
+        f"{report.games} games  {report.plies} plies  {len(report.errors)} errors  "
+        f"{report.seconds:.2f}s  {report.games_per_second:.0f} games/sec"
+    )
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
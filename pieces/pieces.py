@@ -1,121 +1,185 @@
-class Piece:
-    def __init__(self, color: str, position: tuple):
-        self.color = color
-        self.position = position
-        self.first_move = True  # This is important for pawns, kings, and rooks
-
-    def _valid_move(self, row, col):
-        if 0 <= row <= 7 and 0 <= col <= 7:
-            return True
-        return False
-
-    def _append_move_if_valid(self, row, col, move_list):
-        """This rule applies no matter the board state"""
-        if self._valid_move(row, col):
-            move_list.append((row, col))
-
-    def _straight_moves(self):
-        potential_moves = []
-        start_row, start_col = self.position  # 0-7, 0-7
-        potential_rows = [row for row in range(8) if row != start_row]
-        potential_cols = [col for col in range(8) if col != start_col]
-        for potential_row in potential_rows:
-            self._append_move_if_valid(potential_row, start_col, potential_moves)
-        for potential_col in potential_cols:
-            self._append_move_if_valid(start_row, potential_col, potential_moves)
-        return potential_moves
+###############
+# MOVE TABLES
+###############
+
+# Tables are indexed by square, row * 8 + col, and built once at import
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = QUEEN_DIRECTIONS
+# which direction the pieces are moving on the board
+PAWN_DIRECTIONS = {"w": -1, "b": 1}
+PAWN_START_ROWS = {"w": 6, "b": 1}
+KING_HOME_SQUARES = {"w": 60, "b": 4}
+
+
+def _on_board(row, col):
+    return 0 <= row <= 7 and 0 <= col <= 7
+
+
+def _step_targets(square, steps):
+    row, col = divmod(square, 8)
+    return tuple(
+        (row + row_step, col + col_step)
+        for row_step, col_step in steps
+        if _on_board(row + row_step, col + col_step)
+    )
+
+
+def _ray(square, direction):
+    """Squares from square (exclusive) to the edge of the board, nearest first"""
+    row, col = divmod(square, 8)
+    ray = []
+    row, col = row + direction[0], col + direction[1]
+    while _on_board(row, col):
+        ray.append((row, col))
+        row, col = row + direction[0], col + direction[1]
+    return tuple(ray)
+
+
+def _pawn_pushes(square, color):
+    row, col = divmod(square, 8)
+    direction = PAWN_DIRECTIONS[color]
+    if not _on_board(row + direction, col):
+        return ()
+    if row == PAWN_START_ROWS[color]:
+        return ((row + direction, col), (row + 2 * direction, col))
+    return ((row + direction, col),)
+
+
+KNIGHT_TARGETS = [_step_targets(square, KNIGHT_STEPS) for square in range(64)]
+KING_TARGETS = [_step_targets(square, KING_STEPS) for square in range(64)]
+PAWN_PUSHES = {
+    color: [_pawn_pushes(square, color) for square in range(64)] for color in "wb"
+}
+PAWN_CAPTURES = {
+    color: [
+        _step_targets(square, ((direction, -1), (direction, 1))) for square in range(64)
+    ]
+    for color, direction in PAWN_DIRECTIONS.items()
+}
+RAYS = [
+    {direction: _ray(square, direction) for direction in QUEEN_DIRECTIONS}
+    for square in range(64)
+]
+
+
+###############
+# PIECES
+###############
 
-    def _diagonal_moves(self):
-        potential_moves = []
-        start_row, start_col = self.position
 
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+class Piece:
+    """
+    Pieces carry no state beyond their color, so there is one shared instance
+    per type and color: Pawn("w") is Pawn("w"). Where a piece stands is
+    known only to the board, and moves are asked for by square index.
+    """
+
+    __slots__ = ("color",)
+    piece_type = None  # Index into the bitboard piece types, set per class
+    _instances = {}
+
+    def __new__(cls, color: str):
+        piece = Piece._instances.get((cls, color))
+        if piece is None:
+            piece = object.__new__(cls)
+            piece.color = color
+            Piece._instances[(cls, color)] = piece
+        return piece
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.color!r})"
+
+    def __reduce__(self):
+        return type(self), (self.color,)
+
+    def iter_potential_moves(self, square, board=None):
+        """
+        Lazy version of potential_moves for callers that may stop early.
+        Stepping pieces read a precomputed table, so only sliders differ.
+        """
+        return iter(self.potential_moves(square, board))
+
+    def _iter_sliding_moves(self, square, directions, board=None):
+        """
+        Walk each ray outward. Given a board, a ray stops at the first occupied
+        square, which is included so that captures can be considered.
+        """
+        rays = RAYS[square]
         for direction in directions:
-            for step in range(1, 8):
-                move_row = start_row + step * direction[0]
-                move_col = start_col + step * direction[1]
-                if not self._valid_move(move_row, move_col):
+            for row, col in rays[direction]:
+                yield row, col
+                if board is not None and board[row][col] is not None:
                     break
-                self._append_move_if_valid(move_row, move_col, potential_moves)
-        return potential_moves
+
+    def _sliding_moves(self, square, directions, board=None):
+        return list(self._iter_sliding_moves(square, directions, board))
 
 
 class Pawn(Piece):
-    def potential_moves(self):
+    __slots__ = ()
+    piece_type = 0
+
+    def potential_moves(self, square, board=None):
         """This will include potential moves not considering board state"""
-        potential_moves = []  # initiate list of potential moves
-        direction = (
-            -1 if self.color == "w" else 1
-        )  # which direction the pieces are moving on the board
-        start_row, start_col = self.position
-
-        # Move one step forward
-        self._append_move_if_valid(start_row + direction, start_col, potential_moves)
-
-        # Move two steps forward when on the first move
-        if self.first_move:
-            self._append_move_if_valid(
-                start_row + (2 * direction), start_col, potential_moves
-            )
-        # Capturing (normal captures and en-passant)
-        self._append_move_if_valid(
-            start_row + direction, start_col - 1, potential_moves
-        )
-        self._append_move_if_valid(
-            start_row + direction, start_col + 1, potential_moves
-        )
+        # Pushes (two steps from the start row), then captures and en passant
+        return PAWN_PUSHES[self.color][square] + PAWN_CAPTURES[self.color][square]
 
-        return potential_moves
 
+class Knight(Piece):
+    __slots__ = ()
+    piece_type = 1
 
-class Rook(Piece):
-    def potential_moves(self):
-        """Rooks move in straight lines"""
-        return self._straight_moves()
+    def potential_moves(self, square, board=None):
+        return KNIGHT_TARGETS[square]
 
 
-class Knight(Piece):
-    def potential_moves(self):
-        potential_moves = []
-        start_row, start_col = self.position
+class Bishop(Piece):
+    __slots__ = ()
+    piece_type = 2
 
-        knight_steps = [-2, -1, 1, 2]
-        move_combos = [
-            (i, j) for i in knight_steps for j in knight_steps if abs(i) != abs(j)
-        ]
+    def potential_moves(self, square, board=None):
+        """Bishops move in diagonal lines"""
+        return self._sliding_moves(square, BISHOP_DIRECTIONS, board)
 
-        for move in move_combos:
-            move_row = start_row + move[0]
-            move_col = start_col + move[1]
-            self._append_move_if_valid(move_row, move_col, potential_moves)
+    def iter_potential_moves(self, square, board=None):
+        return self._iter_sliding_moves(square, BISHOP_DIRECTIONS, board)
 
-        return potential_moves
 
+class Rook(Piece):
+    __slots__ = ()
+    piece_type = 3
 
-class Bishop(Piece):
-    def potential_moves(self):
-        """Bishops move in diagonal lines"""
-        return self._diagonal_moves()
+    def potential_moves(self, square, board=None):
+        """Rooks move in straight lines"""
+        return self._sliding_moves(square, ROOK_DIRECTIONS, board)
+
+    def iter_potential_moves(self, square, board=None):
+        return self._iter_sliding_moves(square, ROOK_DIRECTIONS, board)
 
 
 class Queen(Piece):
-    def potential_moves(self):
-        return self._straight_moves() + self._diagonal_moves()
+    __slots__ = ()
+    piece_type = 4
+
+    def potential_moves(self, square, board=None):
+        return self._sliding_moves(square, QUEEN_DIRECTIONS, board)
+
+    def iter_potential_moves(self, square, board=None):
+        return self._iter_sliding_moves(square, QUEEN_DIRECTIONS, board)
 
 
 class King(Piece):
+    __slots__ = ()
+    piece_type = 5
 
-    def potential_moves(self):
-        potential_moves = []
-        start_row, start_col = self.position
+    def potential_moves(self, square, board=None):
         # A king can move one square in any direction
-        for row_move in range(-1, 2):
-            for col_move in range(-1, 2):
-                self._append_move_if_valid(
-                    start_row + row_move, start_col + col_move, potential_moves
-                )
-        # A king can castle
-        if self.first_move:
-            row, col = self.position
-            potential_moves.extend([(row, col + 2), (row, col - 2)])
+        potential_moves = KING_TARGETS[square]
+        # A king on its home square may castle; the board checks the rights
+        if square == KING_HOME_SQUARES[self.color]:
+            row, col = divmod(square, 8)
+            potential_moves += ((row, col + 2), (row, col - 2))
         return potential_moves
@@ -0,0 +1,94 @@
+"""
+Piece sprites scaled to the board's square size, cached on disk.
+
+Scaling the source PNGs is the slowest part of opening the window, so each
+sprite is scaled once per square size and saved as a PNG that Tk's own
+PhotoImage can load. A cached file is named after the square size and the
+source image's modification time, so editing an image or resizing the
+window makes a new one; only the few sizes used last are kept. Pillow is
+only imported when something has to be scaled.
+
+    cache = SpriteCache()
+    image = tk.PhotoImage(file=cache.path("white-king", 128))
+"""
+
+import os
+
+KEEP_SIZES = 4  # Square sizes kept on disk per sprite
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "piece_images")
+
+
+def default_cache_dir():
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(root, "chess", "sprites")
+
+
+def _scale(source, target, size):
+    from PIL import Image
+
+    with Image.open(source) as image:
+        scaled = image.convert("RGBA").resize((size, size), Image.LANCZOS)
+    scaled.save(target, format="PNG")
+
+
+class SpriteCache:
+    def __init__(self, source_dir=SOURCE_DIR, cache_dir=None):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.scaled = 0  # Sprites that had to be scaled rather than read from disk
+
+    def path(self, name, size):
+        """Path of name's sprite scaled to size x size, scaling it if needed"""
+        source = os.path.join(self.source_dir, f"{name}.png")
+        mtime = os.stat(source).st_mtime_ns
+        cached = os.path.join(self.cache_dir, f"{name}-{size}-{mtime}.png")
+        if os.path.exists(cached):
+            try:
+                os.utime(cached)  # Marks it recently used for _prune
+            except OSError:
+                pass
+            return cached
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Another window may be filling the cache too, so write then rename
+        partial = f"{cached}.{os.getpid()}.tmp"
+        _scale(source, partial, size)
+        os.replace(partial, cached)
+        self.scaled += 1
+        self._prune(name, mtime)
+        return cached
+
+    def _prune(self, name, mtime):
+        """
+        Drop name's sprites scaled from an older source, and all but the
+        KEEP_SIZES most recently used sizes, so resizing the window through
+        many sizes does not leave a file behind for each.
+        """
+        current = []
+        for entry in os.listdir(self.cache_dir):
+            stem, extension = os.path.splitext(entry)
+            prefix, _, size_and_mtime = stem.rpartition(f"{name}-")
+            fields = size_and_mtime.split("-")
+            if (
+                prefix
+                or extension != ".png"
+                or len(fields) != 2
+                or not fields[0].isdigit()
+            ):
+                continue
+            path = os.path.join(self.cache_dir, entry)
+            try:
+                if fields[1] == str(mtime):
+                    current.append((os.stat(path).st_mtime, path))
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+        current.sort(reverse=True)
+        for _, path in current[KEEP_SIZES:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
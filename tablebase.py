@@ -0,0 +1,587 @@
+"""
+Endgame tablebases: exact win/draw/loss and distance to mate for small sets
+of material (KQK, KRK, KPK, KBNK, ...), found by retrograde analysis with
+BoardState's own move generation.
+
+Every position of a material set has a slot in a flat array, indexed by the
+side to move and the squares of the pieces. Symmetry keeps the tables small:
+the white king is mirrored into the a8-d8-d5 triangle (the a-d files when
+there are pawns). A table is one file holding a signed byte per slot, read
+through mmap, so a probe is an index calculation and a single byte read.
+
+Values are from the side to move's point of view: DRAW is 0, n > 0 wins with
+mate in n plies and n < 0 loses, mated in -n - 1 plies. Positions with
+castling rights or an en passant capture available are not covered.
+
+    python tablebase.py KQK KRK KPK --dir tables --workers 4
+    python tablebase.py probe --dir tables --fen "8/8/8/4k3/8/8/8/4KQ2 w - - 0 1"
+
+    tables = Tablebases("tables")
+    tables.probe(board), tables.best_move(board)
+"""
+
+import argparse
+import array
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+from board import BoardState, FEN_PIECES
+from bitboard import WHITE, BLACK, PAWN, KNIGHT, BISHOP, KING, iter_squares
+from moves import move_start, move_end, move_promotion, move_to_uci
+
+DRAW = 0
+INVALID = -128  # Slot of an impossible position
+MAX_PLIES = 126
+TABLE_HEADER = struct.Struct("<4s8sI")  # magic, material name, slots
+TABLE_MAGIC = b"CTB1"
+CHUNK_SIZE = 4096  # Slots handed to a worker at a time
+
+
+###############
+# VALUES
+###############
+
+
+def wdl(value):
+    """1 for a win, 0 for a draw and -1 for a loss"""
+    return (value > 0) - (value < 0)
+
+
+def plies_to_mate(value):
+    """Plies until mate, either way; None for a draw"""
+    if value == DRAW:
+        return None
+    return value if value > 0 else -value - 1
+
+
+def _mover_value(value):
+    """A value for the side to move after a move, seen by the side that made it"""
+    if value < 0:
+        return -value  # They get mated: we mate one ply later
+    if value > 0:
+        return -(value + 2)  # They mate: one ply further away for us
+    return DRAW
+
+
+###############
+# MATERIAL AND INDEXING
+###############
+
+
+def parse_material(name):
+    """("KQK") -> ((KING, QUEEN), (KING,)), the piece types of each color"""
+    name = name.upper()
+    split = name.find("K", 1)
+    if not name.startswith("K") or split < 0 or "K" in name[split + 1 :]:
+        raise ValueError(f"{name!r} is not a material set such as KQK or KBNK")
+    sides = (name[:split], name[split:])
+    return tuple(
+        (KING,)
+        + tuple(sorted((FEN_PIECES[WHITE].index(c) for c in side[1:]), reverse=True))
+        for side in sides
+    )
+
+
+def material_name(material):
+    return "".join(
+        "".join(FEN_PIECES[WHITE][piece_type] for piece_type in side)
+        for side in material
+    )
+
+
+def _mirror_file(square):
+    return square ^ 7
+
+
+def _mirror_row(square):
+    return square ^ 56
+
+
+def _transpose(square):
+    return (square % 8) * 8 + square // 8
+
+
+def _symmetry(king_square, pawns):
+    """The square mapping that puts the white king on a canonical square"""
+    steps = []
+    if king_square % 8 > 3:
+        steps.append(_mirror_file)
+    if not pawns:
+        if king_square // 8 > 3:
+            steps.append(_mirror_row)
+        square = king_square
+        for step in steps:
+            square = step(square)
+        if square % 8 > square // 8:
+            steps.append(_transpose)
+    mapping = list(range(64))
+    for step in steps:
+        mapping = [step(square) for square in mapping]
+    return tuple(mapping)
+
+
+# Per white king square: the mapping into canonical squares, for boards
+# without and with pawns. KING_SLOTS numbers the canonical king squares.
+SYMMETRIES = tuple(
+    tuple(_symmetry(square, pawns) for square in range(64)) for pawns in (0, 1)
+)
+KING_SLOTS = tuple(
+    {
+        square: slot
+        for slot, square in enumerate(
+            sorted({mappings[square][square] for square in range(64)})
+        )
+    }
+    for mappings in SYMMETRIES
+)
+
+
+class Layout:
+    """How the positions of one material set map to table slots"""
+
+    def __init__(self, material):
+        self.material = material
+        self.name = material_name(material)
+        self.pawns = int(PAWN in material[0] or PAWN in material[1])
+        # (color, piece_type) of every piece, in index order: kings first
+        self.pieces = [(WHITE, KING), (BLACK, KING)] + [
+            (color, piece_type)
+            for color in (WHITE, BLACK)
+            for piece_type in material[color][1:]
+        ]
+        self.king_slots = KING_SLOTS[self.pawns]
+        self.symmetries = SYMMETRIES[self.pawns]
+        self.size = 2 * len(self.king_slots) * 64 ** (len(self.pieces) - 1)
+
+    def index(self, black_to_move, squares):
+        """Slot of a position; squares follow the order of self.pieces"""
+        mapping = self.symmetries[squares[0]]
+        index = (
+            int(black_to_move) * len(self.king_slots)
+            + self.king_slots[mapping[squares[0]]]
+        )
+        for square in squares[1:]:
+            index = index * 64 + mapping[square]
+        return index
+
+    def position(self, index):
+        """(black_to_move, squares) of a slot, the inverse of index"""
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        black_to_move, slot = divmod(index, len(self.king_slots))
+        king_squares = sorted(self.king_slots, key=self.king_slots.get)
+        squares.append(king_squares[slot])
+        return bool(black_to_move), squares[::-1]
+
+
+def _board_material(board):
+    pieces = board.bitboards.pieces
+    return tuple(
+        (KING,)
+        + tuple(
+            piece_type
+            for piece_type in range(KING - 1, -1, -1)
+            for _ in range(pieces[color][piece_type].bit_count())
+        )
+        for color in (WHITE, BLACK)
+    )
+
+
+def _material_of(placement):
+    return tuple(
+        (KING,)
+        + tuple(
+            sorted(
+                (
+                    piece_type
+                    for _, c, piece_type in placement
+                    if c == color and piece_type != KING
+                ),
+                reverse=True,
+            )
+        )
+        for color in (WHITE, BLACK)
+    )
+
+
+def _ordered(layout, placement):
+    squares = {piece: [] for piece in layout.pieces}
+    for square, color, piece_type in placement:
+        squares[(color, piece_type)].append(square)
+    return [squares[piece].pop() for piece in layout.pieces]
+
+
+def is_insufficient(material):
+    """Material that can never give mate: bare kings or one minor piece"""
+    extra = material[0][1:] + material[1][1:]
+    return len(extra) == 0 or (len(extra) == 1 and extra[0] in (KNIGHT, BISHOP))
+
+
+def _flip(material, black_to_move, placement):
+    """The same position with colors swapped and the board turned over"""
+    return (
+        (material[1], material[0]),
+        not black_to_move,
+        [
+            (_mirror_row(square), 1 - color, piece_type)
+            for square, color, piece_type in placement
+        ],
+    )
+
+
+###############
+# TABLES
+###############
+
+
+class Table:
+    """One material set's file, memory-mapped for reading"""
+
+    def __init__(self, path):
+        with open(path, "rb") as stream:
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, name, size = TABLE_HEADER.unpack_from(self._map)
+        if magic != TABLE_MAGIC or len(self._map) != TABLE_HEADER.size + size:
+            self._map.close()
+            raise ValueError(f"{path} is not a tablebase file")
+        self.layout = Layout(parse_material(name.rstrip(b"\0").decode()))
+
+    def close(self):
+        self._map.close()
+
+    def value(self, index):
+        value = self._map[TABLE_HEADER.size + index]
+        return value - 256 if value > 127 else value
+
+    def lookup(self, black_to_move, placement):
+        """Value of a position given as (square, color, piece_type) triples"""
+        return self.value(
+            self.layout.index(black_to_move, _ordered(self.layout, placement))
+        )
+
+
+def _placement(board):
+    mailbox = board.bitboards.mailbox
+    return [
+        (square, (mailbox[square] - 1) // 6, (mailbox[square] - 1) % 6)
+        for square in iter_squares(board.bitboards.occupied)
+    ]
+
+
+def _resolve(tables, material, black_to_move, placement):
+    """Value from the tables, DRAW for insufficient material, else None"""
+    if is_insufficient(material):
+        return DRAW
+    table = tables.get(material)
+    if table is not None:
+        return table.lookup(black_to_move, placement)
+    table = tables.get((material[1], material[0]))
+    if table is not None:
+        return table.lookup(*_flip(material, black_to_move, placement)[1:])
+    return None
+
+
+class Tablebases:
+    """Every table in a directory, probed from any BoardState"""
+
+    def __init__(self, directory):
+        self.tables = {}
+        for entry in sorted(os.listdir(directory)):
+            if entry.endswith(".tb"):
+                table = Table(os.path.join(directory, entry))
+                self.tables[table.layout.material] = table
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def probe(self, board):
+        """The position's value, or None when no table covers it"""
+        if board.castling_rights or (
+            board.ep_square is not None and board._can_capture_en_passant()
+        ):
+            return None
+        return _resolve(
+            self.tables,
+            _board_material(board),
+            not board.white_to_move,
+            _placement(board),
+        )
+
+    def best_move(self, board):
+        """
+        The move that wins fastest, or draws, or loses slowest; None when
+        the position is not covered or there is no legal move.
+        """
+        if self.probe(board) is None:
+            return None
+        best, best_value = None, None
+        for move in board.generate_legal_moves():
+            board.make_move(move)
+            value = self.probe(board)
+            board.unmake_move()
+            if value is None:
+                return None
+            value = _mover_value(value)
+            if best_value is None or _preference(value) > _preference(best_value):
+                best, best_value = move, value
+        return best
+
+
+def _preference(value):
+    """Sort key: quick wins first, then draws, then slow losses"""
+    if value > 0:
+        return 1000 - value
+    if value < 0:
+        return -1000 - value
+    return 0
+
+
+###############
+# GENERATION
+###############
+
+_worker_tables = {}  # Finished tables, opened once per worker process
+
+
+def _load_tables(paths):
+    for path in paths:
+        if path not in _worker_tables:
+            _worker_tables[path] = Table(path)
+    return {
+        _worker_tables[path].layout.material: _worker_tables[path] for path in paths
+    }
+
+
+def _successors(layout, tables, index):
+    """
+    None for an impossible slot, else (successor slots in this table,
+    values of moves into other tables, whether the side to move is in check)
+    """
+    black_to_move, squares = layout.position(index)
+    if len(set(squares)) != len(squares):
+        return None
+    placement = [
+        (square, color, piece_type)
+        for square, (color, piece_type) in zip(squares, layout.pieces)
+    ]
+    for square, color, piece_type in placement:
+        if piece_type == PAWN and square // 8 in (0, 7):
+            return None
+    board = BoardState(empty=True, move_cache_size=1)
+    board._load_placement(placement)
+    board.castling_rights = 0
+    board.white_to_move = not black_to_move
+    mover = BLACK if black_to_move else WHITE
+    waiting = board.bitboards.king_square(1 - mover)
+    if board.bitboards.is_attacked(waiting, mover):
+        return None  # The side not to move is in check
+
+    own, exits = array.array("I"), []
+    slots = {square: slot for slot, square in enumerate(squares)}
+    for move in board.generate_legal_moves():
+        start, end, promotion = move_start(move), move_end(move), move_promotion(move)
+        if not promotion and end not in slots:  # Same material, one piece moved
+            moved = list(squares)
+            moved[slots[start]] = end
+            own.append(layout.index(not black_to_move, moved))
+            continue
+        after = []
+        for square, color, piece_type in placement:
+            if square == end:
+                continue  # Captured
+            if square == start:
+                after.append((end, color, promotion or piece_type))
+            else:
+                after.append((square, color, piece_type))
+        material = _material_of(after)
+        if material == layout.material:
+            own.append(layout.index(not black_to_move, _ordered(layout, after)))
+            continue
+        value = _resolve(tables, material, not black_to_move, after)
+        if value is None:
+            raise LookupError(f"generate {material_name(material)} first")
+        exits.append(_mover_value(value))
+    return own, exits, board.in_check()
+
+
+def _solve_chunk(name, start, stop, table_paths):
+    layout = Layout(parse_material(name))
+    tables = _load_tables(table_paths)
+    return start, [_successors(layout, tables, index) for index in range(start, stop)]
+
+
+def dependencies(material):
+    """Material sets one capture or promotion away that still need a table"""
+    found = set()
+    for color in (WHITE, BLACK):
+        side = material[color]
+        for position, piece_type in enumerate(side):
+            if piece_type == KING:
+                continue
+            rest = side[:position] + side[position + 1 :]
+            options = [rest]  # Captured
+            if piece_type == PAWN:
+                options += [
+                    tuple(sorted(rest + (promoted,), reverse=True))
+                    for promoted in range(KNIGHT, KING)
+                ]
+            for new_side in options:
+                new = (
+                    (new_side, material[1])
+                    if color == WHITE
+                    else (material[0], new_side)
+                )
+                if new != material and not is_insufficient(new):
+                    found.add(new)
+    return found
+
+
+def generate(name, directory, workers=None):
+    """
+    Build the table for material set name (and, first, any it depends on)
+    in directory. Returns the path of the new file.
+    """
+    material = parse_material(name)
+    path = os.path.join(directory, f"{material_name(material)}.tb")
+    if os.path.exists(path):
+        return path
+    table_paths = []
+    for needed in sorted(dependencies(material)):
+        flipped = (needed[1], needed[0])
+        flipped_path = os.path.join(directory, f"{material_name(flipped)}.tb")
+        if os.path.exists(flipped_path):
+            table_paths.append(flipped_path)
+        else:
+            table_paths.append(generate(material_name(needed), directory, workers))
+
+    layout = Layout(material)
+    workers = workers or os.cpu_count() or 1
+    chunks = [
+        (layout.name, start, min(start + CHUNK_SIZE, layout.size), table_paths)
+        for start in range(0, layout.size, CHUNK_SIZE)
+    ]
+    if workers == 1:
+        results = itertools.starmap(_solve_chunk, chunks)
+        values = _retrograde(layout.size, results)
+    else:
+        with multiprocessing.get_context().Pool(workers) as pool:
+            values = _retrograde(
+                layout.size, pool.imap_unordered(_star_solve_chunk, chunks)
+            )
+
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as stream:
+        stream.write(TABLE_HEADER.pack(TABLE_MAGIC, layout.name.encode(), layout.size))
+        stream.write(values.tobytes())
+    os.replace(partial, path)
+    return path
+
+
+def _star_solve_chunk(arguments):
+    return _solve_chunk(*arguments)
+
+
+def _retrograde(size, results):
+    """
+    Values of every slot from the chunks' successor lists. Positions are
+    settled in order of plies to mate: a position wins as soon as one move
+    reaches a lost position, and loses once every move reaches a won one.
+    """
+    values = array.array("b", [INVALID]) * size
+    predecessors = {}
+    remaining = array.array("H", bytes(2 * size))  # Moves not yet known to lose
+    longest = array.array("b", bytes(size))  # Longest mate among those moves
+    buckets = [[] for _ in range(MAX_PLIES + 2)]  # By plies: (slot, value)
+
+    for start, chunk in results:
+        for index, entry in enumerate(chunk, start):
+            if entry is None:
+                continue
+            own, exits, in_check = entry
+            values[index] = DRAW
+            for successor in own:
+                predecessors.setdefault(successor, []).append(index)
+            remaining[index] = len(own) + len(exits)
+            if not own and not exits:
+                if in_check:
+                    buckets[0].append((index, -1))
+                continue
+            for value in exits:
+                if value > 0:
+                    buckets[value].append((index, value))
+                elif value < 0:
+                    remaining[index] -= 1
+                    longest[index] = max(longest[index], -value - 1)
+            if not remaining[index]:  # Every move leaves the table and loses
+                plies = longest[index] + 1
+                buckets[plies].append((index, -plies - 1))
+
+    settled = bytearray(size)
+    for plies, bucket in enumerate(buckets):
+        for index, value in bucket:
+            if settled[index]:
+                continue
+            if plies > MAX_PLIES:
+                raise OverflowError("mate is too far away for a one-byte table")
+            settled[index] = 1
+            values[index] = value
+            for earlier in predecessors.get(index, ()):
+                if settled[earlier]:
+                    continue
+                if value < 0:  # Moving here wins
+                    buckets[plies + 1].append((earlier, plies + 1))
+                else:
+                    remaining[earlier] -= 1
+                    longest[earlier] = max(longest[earlier], plies)
+                    if not remaining[earlier]:
+                        loss = longest[earlier] + 1
+                        buckets[loss].append((earlier, -loss - 1))
+    return values
+
+
+###############
+# CLI
+###############
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tables")
+    parser.add_argument("materials", nargs="+", help="e.g. KQK KRK KPK, or probe")
+    parser.add_argument("--dir", default="tables", help="where tables are kept")
+    parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    parser.add_argument("--fen", help="position to probe")
+    args = parser.parse_args(argv)
+
+    if args.materials == ["probe"]:
+        board = BoardState.from_fen(args.fen)
+        tables = Tablebases(args.dir)
+        value = tables.probe(board)
+        if value is None:
+            print("not in the tables")
+        else:
+            outcome = ("loss", "draw", "win")[wdl(value) + 1]
+            plies = plies_to_mate(value)
+            best = tables.best_move(board)
+            print(
+                f"{outcome}"
+                + (f", mate in {plies} plies" if plies is not None else "")
+                + (f", best {move_to_uci(best)}" if best is not None else "")
+            )
+        tables.close()
+        return
+    for name in args.materials:
+        started = time.perf_counter()
+        path = generate(name, args.dir, args.workers)
+        print(f"{path}  {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
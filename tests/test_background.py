@@ -0,0 +1,57 @@
+import threading
+import time
+
+from background import BackgroundTasks
+
+
+class FakeRoot:
+    """Stands in for Tk: after() callbacks run when the test calls run_pending"""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback):
+        self.pending.append(callback)
+
+    def run_pending(self):
+        callbacks, self.pending = self.pending, []
+        for callback in callbacks:
+            callback()
+
+
+def wait_for(future):
+    future.result(timeout=5)
+    time.sleep(0.01)  # Let the done callback queue the result
+
+
+def test_results_and_progress_arrive_on_the_polling_thread():
+    root = FakeRoot()
+    tasks = BackgroundTasks(root)
+    seen = []
+
+    def job(count, report):
+        for step in range(count):
+            report(step)
+        return threading.get_ident()
+
+    wait_for(tasks.submit("work", job, 3, on_progress=seen.append, on_done=seen.append))
+    assert seen == []  # Nothing is delivered until the poll runs
+    root.run_pending()
+    assert seen[:3] == [0, 1, 2] and seen[3] != threading.get_ident()
+    assert not tasks.busy("work")
+    tasks.close()
+
+
+def test_cancel_drops_results_and_stops_the_job():
+    root = FakeRoot()
+    tasks = BackgroundTasks(root)
+    stop = threading.Event()
+    seen = []
+    future = tasks.submit("work", stop.wait, 5, on_done=seen.append, on_cancel=stop.set)
+    assert tasks.busy("work")
+    tasks.cancel("work")
+    wait_for(future)
+    wait_for(tasks.submit("work", lambda: "second", on_done=seen.append))
+    root.run_pending()
+    assert seen == ["second"]
+    tasks.close()
@@ -25,3 +25,191 @@ def test_castling():
     board.move_piece((7, 4), (7, 2))  # Attempt to castle queenside
     assert isinstance(board.board[7][2], King), "King should be castled"
     assert isinstance(board.board[7][3], Rook), "Rook should be castled"
+
+
+def test_illegal_moves_are_ignored():
+    board = BoardState()
+    board.move_piece((7, 4), (7, 6))  # Castling through the bishop
+    board.move_piece((6, 4), (3, 4))  # Pawn three squares forward
+    assert board.white_to_move and board.to_fen() == BoardState().to_fen()
+    assert isinstance(board.board[7][4], King)
+    assert isinstance(board.board[6][4], Pawn)
+
+
+def test_bitboards_follow_board_writes():
+    board = BoardState()
+    assert board.bitboards.occupied.bit_count() == 32
+    board.board[7][1] = None
+    board.move_piece((6, 4), (4, 4))
+    assert board.bitboards.occupied.bit_count() == 31
+    assert board._get_king_position(opponent_king=True) == (7, 4)
+    assert board._is_square_under_attack((5, 5))  # f3 is covered by white's g-pawn
+    assert not board._is_square_under_attack((4, 4))
+
+
+def test_make_unmake_restores_position():
+    from moves import encode_move
+
+    board = BoardState()
+    for start, end in [((6, 4), (4, 4)), ((1, 0), (2, 0)), ((4, 4), (3, 4))]:
+        board.move_piece(start, end)
+    board.move_piece((1, 3), (3, 3))  # d7-d5 allows exd6 en passant
+    assert board.ep_square == 19
+    board.make_move(encode_move(28, 19))
+    assert board.board[3][3] is None and isinstance(board.board[2][3], Pawn)
+    board.unmake_move()
+    assert isinstance(board.board[3][3], Pawn) and isinstance(board.board[3][4], Pawn)
+    assert board.board[3][4] is Pawn("w")
+    assert board.ep_square == 19 and board.white_to_move
+    assert board.castling_rights == 15
+
+
+def test_attack_maps_block_castling_through_check():
+    board = BoardState()
+    for col in (5, 6):
+        board.board[7][col] = None
+    board.board[6][5] = None
+    board.board[2][5] = Rook("b")
+    assert board.attackers_of((7, 5), "b") == [(2, 5)]
+    king_moves = board.filter_legal_moves_for_check((7, 4))
+    assert (7, 6) not in king_moves and (7, 5) not in king_moves
+    board.board[2][5] = None
+    assert (7, 6) in board.filter_legal_moves_for_check((7, 4))
+
+
+def test_pinned_piece_and_check_evasions():
+    board = BoardState()
+    board.board[6][4] = Knight("w")
+    board.board[3][4] = Rook("b")
+    board.board[1][4] = None
+    assert board.filter_legal_moves_for_check((6, 4)) == []
+    board.board[6][4] = None  # The rook now gives check
+    assert board.check_white
+    assert board.filter_legal_moves_for_check((7, 6)) == [(6, 4)]
+    assert board.filter_legal_moves_for_check((6, 3)) == []
+
+
+def test_zobrist_key_follows_moves():
+    board = BoardState()
+    start_key = board.zobrist_key
+    for start, end in [((7, 6), (5, 5)), ((0, 6), (2, 5)), ((7, 1), (5, 2))]:
+        board.move_piece(start, end)
+    other = BoardState()
+    for start, end in [((7, 1), (5, 2)), ((0, 6), (2, 5)), ((7, 6), (5, 5))]:
+        other.move_piece(start, end)
+    assert board.zobrist_key == other.zobrist_key != start_key
+    board.unmake_move()
+    board.unmake_move()
+    board.unmake_move()
+    assert board.zobrist_key == start_key
+    # A double step nobody can capture en passant does not change the key
+    board.move_piece((6, 4), (4, 4))
+    key = board.zobrist_key
+    board.ep_square = None
+    assert board.zobrist_key == key
+
+
+def test_fen_round_trip():
+    from board import START_FEN
+
+    board = BoardState.from_fen(START_FEN)
+    assert board.to_fen() == START_FEN == BoardState().to_fen()
+    assert board.zobrist_key == BoardState().zobrist_key
+    fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b Kq e3 7 42"
+    board = BoardState.from_fen(fen)
+    assert board.to_fen() == fen
+    assert BoardState.from_bytes(board.to_bytes()).to_fen() == fen
+    # Clocks follow moves and are restored by unmake
+    board = BoardState()
+    board.move_piece((7, 6), (5, 5))
+    board.move_piece((0, 6), (2, 5))
+    assert board.to_fen().endswith(" w KQkq - 2 2")
+    board.move_piece((6, 4), (4, 4))
+    assert board.to_fen().endswith(" b KQkq e3 0 2")
+    for _ in range(3):
+        board.unmake_move()
+    assert board.to_fen() == START_FEN
+    with pytest.raises(ValueError):
+        BoardState.from_fen("rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+
+
+def test_legal_move_cache():
+    board = BoardState(move_cache_size=2)
+    assert board.legal_moves() == tuple(board.generate_legal_moves())
+    board.filter_legal_moves_for_check((6, 4))
+    board.filter_legal_moves_for_check((7, 6))
+    assert (board.move_cache.hits, board.move_cache.misses) == (2, 1)
+    # Captures, en passant and castling all give positions with their own entries
+    line = [
+        ((6, 4), (4, 4)), ((1, 0), (2, 0)), ((4, 4), (3, 4)), ((1, 3), (3, 3)),
+        ((3, 4), (2, 3)), ((2, 0), (3, 0)), ((7, 6), (5, 5)), ((3, 0), (4, 0)),
+        ((7, 5), (4, 2)), ((1, 2), (2, 3)), ((7, 4), (7, 6)),
+    ]  # fmt: skip
+    for start, end in line:
+        assert set(board.legal_moves()) == set(board.generate_legal_moves())
+        board.move_piece(start, end)
+    assert isinstance(board.board[7][5], Rook)
+    while board.move_log:
+        board.unmake_move()
+        assert set(board.legal_moves()) == set(board.generate_legal_moves())
+    assert len(board.move_cache) == 2
+
+
+def test_outcome():
+    from board import CHECKMATE, STALEMATE, INSUFFICIENT_MATERIAL, FIFTY_MOVES
+    from board import THREEFOLD_REPETITION
+
+    board = BoardState()
+    for start, end in [((6, 5), (5, 5)), ((1, 4), (3, 4)), ((6, 6), (4, 6))]:
+        board.move_piece(start, end)
+    assert board.outcome() is None
+    board.move_piece((0, 3), (4, 7))  # Fool's mate
+    assert board.outcome() == (CHECKMATE, "b") and board.outcome().result == "0-1"
+    assert BoardState.from_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1").outcome() == (
+        STALEMATE,
+        None,
+    )
+    for fen in ("8/8/4k3/8/8/3BK3/8/8 w - - 0 1", "8/1b6/4k3/8/8/3BK3/8/8 w - - 0 1"):
+        assert BoardState.from_fen(fen).outcome().termination == INSUFFICIENT_MATERIAL
+    assert BoardState.from_fen("8/2b5/4k3/8/8/3BK3/8/8 w - - 0 1").outcome() is None
+    fen = "4k3/8/8/8/8/8/8/R3K3 w - - 100 80"
+    assert BoardState.from_fen(fen).outcome().termination == FIFTY_MOVES
+
+    board = BoardState()
+    shuffle = [((7, 6), (5, 5)), ((0, 6), (2, 5)), ((5, 5), (7, 6)), ((2, 5), (0, 6))]
+    for start, end in shuffle * 2:
+        assert board.outcome() is None
+        board.move_piece(start, end)
+    assert board.repetitions() == 3
+    assert board.outcome().termination == THREEFOLD_REPETITION
+    board.unmake_move()
+    assert board.repetitions() == 2
+    while board.move_log:
+        board.unmake_move()
+    assert board.position_counts == {}
+
+
+def test_lazy_queries():
+    from moves import move_to_uci
+
+    board = BoardState.from_fen(
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    )
+    assert next(board.iter_legal_moves()) in board.generate_legal_moves()
+    assert sorted(board.iter_legal_moves()) == sorted(board.generate_legal_moves())
+    assert board.is_attacked((2, 5))  # f6, by the queen
+    assert not board.is_attacked((5, 5), "b")
+    board = BoardState.from_fen("5k2/8/8/8/8/8/8/4K2R w K - 0 1")
+    checks = [move for move in board.iter_legal_moves() if board.gives_check(move)]
+    assert sorted(map(move_to_uci, checks)) == ["e1g1", "h1f1", "h1h8"]
+
+
+def test_headless_import_skips_gui_libraries():
+    import subprocess
+    import sys
+
+    code = "import sys, board, parallel; print(sorted(sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert "tkinter" not in output and "PIL" not in output
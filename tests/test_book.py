@@ -0,0 +1,71 @@
+import io
+
+from board import BoardState
+from book import ENTRY, OpeningBook, build_book, encode_book_move
+from moves import move_from_uci, move_to_uci
+from pgn import read_games
+from polyglot import polyglot_key
+
+GAMES = """
+[Result "1-0"]
+1. e4 e5 2. Nf3 Nc6 3. Bc4 Nf6 4. O-O 1-0
+
+[Result "1/2-1/2"]
+1. e4 c5 2. Nf3 1/2-1/2
+
+[Result "0-1"]
+1. d4 d5 0-1
+"""
+
+
+def test_build_and_probe(tmp_path):
+    path = str(tmp_path / "book.bin")
+    assert build_book(read_games(io.StringIO(GAMES)), path) == 11
+    board = BoardState()
+    with OpeningBook(path) as book:
+        assert len(book) == 11
+        entries = [
+            (move_to_uci(move), weight) for move, weight, _ in book.entries(board)
+        ]
+        assert entries == [("e2e4", 3), ("d2d4", 0)]
+        assert move_to_uci(book.choose(board)) == "e2e4"  # d4 only ever lost
+        for move in "e2e4 e7e5 g1f3 b8c6 f1c4 g8f6".split():
+            board.make_move(move_from_uci(move))
+        assert move_to_uci(book.choose(board, best=True)) == "e1g1"
+        board.make_move(move_from_uci("e1g1"))
+        assert book.choose(board) is None
+
+
+def test_castling_is_written_as_king_takes_rook(tmp_path):
+    board = BoardState.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    assert encode_book_move(board, move_from_uci("e1g1")) == 4 << 6 | 7
+    assert encode_book_move(board, move_from_uci("e1c1")) == 4 << 6 | 0
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    with OpeningBook(str(empty)) as book:
+        assert len(book) == 0 and book.choose(board) is None
+
+
+def test_polyglot_keys():
+    # Reference keys from the Polyglot book format description
+    board = BoardState()
+    assert polyglot_key(board) == 0x463B96181691FC9C
+    expected = [
+        ("e2e4", 0x823C9B50FD114196),
+        ("d7d5", 0x0756B94461C50FB0),
+        ("e4e5", 0x662FAFB965DB29D4),
+        ("f7f5", 0x22A48B5A8E47FF78),  # The en passant file counts
+        ("e1e2", 0x652A607CA3F242C1),
+        ("e8f7", 0x00FDD303C946BDD9),
+    ]
+    for text, key in expected:
+        board.make_move(move_from_uci(text))
+        assert polyglot_key(board) == key
+
+
+def test_reads_books_from_other_tools(tmp_path):
+    # A one-entry book as any Polyglot tool writes it: 1. e4 from the start
+    path = tmp_path / "book.bin"
+    path.write_bytes(ENTRY.pack(0x463B96181691FC9C, 12 << 6 | 28, 1, 0))
+    with OpeningBook(str(path)) as book:
+        assert move_to_uci(book.choose(BoardState())) == "e2e4"
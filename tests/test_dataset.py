@@ -0,0 +1,93 @@
+import random
+
+import pytest
+from board import BoardState
+from dataset import (
+    RECORD,
+    PositionDataset,
+    PositionWriter,
+    pack_position,
+    unpack_position,
+)
+from perft import REFERENCE_POSITIONS
+
+
+def _random_positions(count, seed=7):
+    rng = random.Random(seed)
+    boards = [BoardState.from_fen(fen) for fen, _ in REFERENCE_POSITIONS.values()]
+    board = BoardState()
+    while len(boards) < count:
+        moves = board.legal_moves()
+        if not moves or board.outcome() is not None:
+            board = BoardState()
+            continue
+        board.make_move(rng.choice(moves))
+        boards.append(BoardState.from_fen(board.to_fen()))
+    return boards
+
+
+def test_pack_round_trip():
+    for board in _random_positions(300):
+        data = pack_position(board)
+        assert len(data) == RECORD.size == 32
+        copy = unpack_position(data)
+        assert copy.to_fen() == board.to_fen()
+        assert copy.zobrist_key == board.zobrist_key
+        assert sorted(copy.legal_moves()) == sorted(board.legal_moves())
+
+
+def test_too_many_pieces():
+    board = BoardState.from_fen(
+        "k7/pppppppp/8/8/8/PPPPPPPP/NNNNNNNN/RNBQKBNR w - - 0 1"
+    )
+    with pytest.raises(ValueError):
+        pack_position(board)
+
+
+def test_write_and_read(tmp_path):
+    path = tmp_path / "positions.bin"
+    boards = _random_positions(50)
+    with PositionWriter(path) as writer:
+        writer.extend(boards[:30])
+    with PositionWriter(path) as writer:  # Appends to the existing file
+        for board in boards[30:]:
+            writer.append(board)
+        assert writer.written == 20
+    assert path.stat().st_size == 32 * 51
+
+    with PositionDataset(path) as dataset:
+        assert len(dataset) == 50
+        assert dataset[37].to_fen() == boards[37].to_fen()
+        assert dataset[-1].to_fen() == boards[-1].to_fen()
+        assert dataset.record(3) == pack_position(boards[3])
+        assert [board.to_fen() for board in dataset] == [
+            board.to_fen() for board in boards
+        ]
+        with pytest.raises(IndexError):
+            dataset[50]
+
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        PositionDataset(path)
+
+
+def test_numpy_views(tmp_path):
+    np = pytest.importorskip("numpy")
+    from dataset import mailboxes_from_records, side_to_move
+    from evaluation import evaluate_batch, evaluate_placement
+
+    boards = _random_positions(40)
+    path = tmp_path / "positions.bin"
+    with PositionWriter(path) as writer:
+        writer.extend(boards)
+    with PositionDataset(path) as dataset:
+        records = dataset.array()
+        assert len(records) == 40 and not records.flags.writeable
+        mailboxes = mailboxes_from_records(records)
+        white = side_to_move(records)
+        del records
+    assert mailboxes.tolist() == [list(board.bitboards.mailbox) for board in boards]
+    assert white.tolist() == [board.white_to_move for board in boards]
+    assert evaluate_batch(mailboxes).tolist() == [
+        evaluate_placement(board.bitboards.mailbox) for board in boards
+    ]
@@ -0,0 +1,50 @@
+from engine import Engine, TranspositionTable, EXACT, LOWER, MATE_BOUND, MAX_PLY
+from moves import move_from_uci, move_to_uci
+from board import BoardState
+
+
+def test_finds_mate_in_one():
+    board = BoardState.from_fen(
+        "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 2 3"
+    )
+    result = Engine(hash_mb=1).search(board, depth=3)
+    assert move_to_uci(result.best_move) == "f3f7"
+    assert result.score > MATE_BOUND
+
+
+def test_node_budget_restores_board():
+    board = BoardState.from_fen(
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"
+    )
+    key = board.zobrist_key
+    depths = []
+    result = Engine(hash_mb=1).search(
+        board, nodes=3000, info=lambda info: depths.append(info.depth)
+    )
+    assert result.nodes <= 3000
+    assert result.best_move in board.generate_legal_moves()
+    assert depths == list(range(1, result.depth + 1))
+    assert board.zobrist_key == key and not board._undo_stack
+    assert 0 < result.tt_hit_rate < 1 and result.nps > 0
+
+
+def test_transposition_table_replacement():
+    tt = TranspositionTable(size_mb=1)
+    move = move_from_uci("e2e4")
+    tt.store(12345, move, -50, 6, EXACT)
+    assert tt.probe(12345) == (move, -50, 6, EXACT)
+    colliding_key = 12345 + len(tt)  # same slot, different position
+    tt.store(colliding_key, 0, 10, 2, LOWER)
+    assert tt.probe(colliding_key) is None  # the deeper entry was kept
+    tt.new_search()
+    tt.store(colliding_key, 0, 10, 2, LOWER)
+    assert tt.probe(colliding_key) == (0, 10, 2, LOWER)
+
+
+def test_quiescence_stops_at_max_ply_in_check():
+    # A check this deep used to index past the end of the killer table
+    board = BoardState.from_fen("4k3/8/8/8/8/8/4q3/4K3 w - - 0 1")
+    engine = Engine(hash_mb=1)
+    engine.search(board, depth=1)
+    for ply in (MAX_PLY, MAX_PLY + 1):
+        engine._quiescence(board, -(10**6), 10**6, ply)
@@ -0,0 +1,40 @@
+import pytest
+
+from board import BoardState
+from evaluation import evaluate, evaluate_placement
+
+
+def test_score_follows_make_and_unmake():
+    board = BoardState.from_fen(
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    )
+    start = evaluate(board)
+    for move in board.generate_legal_moves():  # Captures, castling, quiet moves
+        board.make_move(move)
+        assert board.bitboards.score == evaluate_placement(board.bitboards.mailbox)
+        for reply in board.generate_legal_moves()[:5]:
+            board.make_move(reply)
+            assert evaluate(board) == evaluate_placement(board.bitboards.mailbox)
+            board.unmake_move()
+        board.unmake_move()
+    assert evaluate(board) == start
+    assert evaluate(BoardState()) == 0
+
+
+def test_batch_matches_single_positions():
+    np = pytest.importorskip("numpy")
+    from evaluation import evaluate_batch, mailbox_array, planes_from_mailboxes
+
+    boards = [BoardState()]
+    for start, end in [((6, 4), (4, 4)), ((1, 3), (3, 3)), ((4, 4), (3, 3))]:
+        boards.append(BoardState.from_fen(boards[-1].to_fen()))
+        boards[-1].move_piece(start, end)
+    expected = [evaluate(board) for board in boards]
+    mailboxes = mailbox_array(boards)
+    to_move = [board.white_to_move for board in boards]
+    assert evaluate_batch(mailboxes, to_move).tolist() == expected
+    assert (
+        evaluate_batch(planes_from_mailboxes(mailboxes), to_move).tolist() == expected
+    )
+    with pytest.raises(ValueError):
+        evaluate_batch(np.zeros((2, 32)))
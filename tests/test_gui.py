@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+from gui import ChessGUI
+from board import BoardState
+
+
+class FakeCanvas:
+    """Records sprites by id so tests can see what the renderer touched"""
+
+    def __init__(self):
+        self.items = {}
+        self.created = self.moved = self.deleted = 0
+
+    def create_image(self, x, y, image):
+        self.created += 1
+        self.items[self.created] = (x, y, image)
+        return self.created
+
+    def coords(self, item, x, y):
+        self.moved += 1
+        self.items[item] = (x, y, self.items[item][2])
+
+    def delete(self, item):
+        self.deleted += 1
+        self.items.pop(item, None)
+
+    def create_oval(self, *bounds, fill):
+        return self.create_image(bounds[0], bounds[1], fill)
+
+    def itemconfig(self, item, **options):
+        pass
+
+
+def make_gui():
+    gui = ChessGUI.__new__(ChessGUI)
+    gui.canvas = FakeCanvas()
+    gui.square_side = 8
+    gui.board_state = BoardState()
+    gui.piece_sprites = {}
+    gui.drawn_placement = bytes(64)
+    gui._get_piece_image = lambda piece: piece
+    gui.sync_pieces()
+    return gui
+
+
+def test_sync_only_touches_changed_squares():
+    gui = make_gui()
+    canvas = gui.canvas
+    assert canvas.created == 32 and len(canvas.items) == 32
+    for start, end in [((6, 4), (4, 4)), ((1, 3), (3, 3))]:
+        gui.board_state.move_piece(start, end)
+        gui.sync_pieces()
+    assert (canvas.created, canvas.moved, canvas.deleted) == (32, 2, 0)
+    gui.board_state.move_piece((4, 4), (3, 3))  # exd5
+    gui.sync_pieces()
+    assert (canvas.created, canvas.moved, canvas.deleted) == (32, 3, 1)
+    sprite = gui.piece_sprites[27]
+    assert canvas.items[sprite] == (28, 28, gui.board_state.board[3][3])
+    assert len(canvas.items) == 31 == len(gui.piece_sprites)
+
+
+class FakeTasks:
+    def submit(self, channel, job, *args, on_done=None):
+        self.job, self.args, self.on_done = job, args, on_done
+
+
+def test_legal_moves_are_found_on_a_copy():
+    gui = make_gui()
+    gui.board_state = BoardState.from_fen(
+        "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"
+    )
+    gui.squares = {(row, col): (row, col) for row in range(8) for col in range(8)}
+    gui.cur_highlighted = None
+    gui.legal_move_circles, gui.outlined_squares = [], []
+    gui.tasks = FakeTasks()
+    gui._highlight_selected_piece((3, 4))
+    assert gui.tasks.args[0] is not gui.board_state
+    gui.tasks.on_done(gui.tasks.job(*gui.tasks.args))
+    assert sorted(gui.legal_moves) == [(2, 4), (2, 5)]
+    assert gui.outlined_squares == [(2, 5)]  # The en passant capture
+
+    # The moves went into the live board's cache, so a second click finds them
+    gui.tasks = FakeTasks()
+    gui._highlight_selected_piece((3, 4))
+    assert not hasattr(gui.tasks, "job")
+    assert gui.board_state.move_cache.hits == 1
+    assert sorted(gui.legal_moves) == [(2, 4), (2, 5)]
+
+
+class FakeRoot:
+    def __init__(self):
+        self.pending = {}
+
+    def after(self, delay, callback, *args):
+        self.pending[len(self.pending) + 1] = (callback, args)
+        return len(self.pending)
+
+    def after_cancel(self, job):
+        self.pending[job] = None
+
+
+def test_resizes_are_debounced():
+    gui = make_gui()
+    gui.root, gui._resize_job = FakeRoot(), None
+    for width in (300, 400, 500):
+        gui.resize_board(SimpleNamespace(width=width, height=800))
+    waiting = [job for job in gui.root.pending.values() if job is not None]
+    assert waiting == [(gui._apply_resize, (62,))]
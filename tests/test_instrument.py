@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from board import BoardState
+from instrument import instrument
+
+
+def test_counts_calls_and_restores_methods(tmp_path):
+    original = BoardState.__dict__["filter_legal_moves_for_check"]
+    board = BoardState()
+    with instrument() as stats:
+        board.filter_legal_moves_for_check((6, 4))
+        board.move_piece((6, 4), (4, 4))
+        with pytest.raises(RuntimeError):
+            with instrument():
+                pass
+    assert BoardState.__dict__["filter_legal_moves_for_check"] is original
+    record = stats["filter_legal_moves_for_check"]
+    assert record.calls == 1 and 0 < record.own_seconds <= record.seconds
+    # move_piece checks its move against legal_moves(), served from the cache
+    assert stats["legal_moves"].calls == 2 and stats["make_move"].calls == 1
+    assert stats["generate_legal_moves"].calls == stats["_get_pins"].calls == 1
+    assert "filter_legal_moves_for_check" in stats.report()
+    stats.dump(tmp_path / "stats.json")
+    saved = json.loads((tmp_path / "stats.json").read_text())
+    assert saved["functions"]["make_move"]["calls"] == 1
+    board.filter_legal_moves_for_check((1, 4))  # Not counted any more
+    assert record.calls == 1
+
+
+def test_generators_are_refused():
+    with pytest.raises(TypeError):
+        with instrument(["iter_legal_moves"]):
+            pass
+    with instrument():  # The failed block left nothing wrapped or locked
+        pass
@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import parallel
+from board import BoardState
+from parallel import ParallelEngine
+
+
+def test_parallel_search_combines_workers():
+    board = BoardState()
+    board.move_piece((6, 4), (4, 4))
+    key = board.zobrist_key
+    depths = []
+    with ParallelEngine(workers=2, hash_mb=1) as engine:
+        result = engine.search(board, depth=3, info=lambda r: depths.append(r.depth))
+        assert result.best_move in board.generate_legal_moves()
+        assert result.depth == 3 and depths == [1, 2, 3]
+        assert result.tt_hits > 0
+        # The second search finds the first one's entries in the shared table
+        again = engine.search(board, depth=3)
+        assert again.tt_hit_rate > result.tt_hit_rate
+    assert board.zobrist_key == key
+
+
+def test_positions_round_trip_through_bytes():
+    board = BoardState()
+    board.move_piece((6, 4), (4, 4))
+    copy = BoardState.from_bytes(board.to_bytes())
+    assert copy.zobrist_key == board.zobrist_key
+    assert copy.ep_square == board.ep_square == 44
+    assert sorted(copy.generate_legal_moves()) == sorted(board.generate_legal_moves())
+
+
+def test_close_during_search_does_not_hang(monkeypatch):
+    monkeypatch.setattr(parallel, "STOP_GRACE_SECONDS", 0.2)
+    engine = ParallelEngine(workers=1, hash_mb=1)
+    with ThreadPoolExecutor(1) as executor:
+        search = executor.submit(engine.search, BoardState(), movetime=30.0)
+        time.sleep(0.5)
+        engine.stop()
+        engine.close()
+        with pytest.raises(RuntimeError):
+            search.result(timeout=5)
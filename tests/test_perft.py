@@ -0,0 +1,19 @@
+import pytest
+from board import BoardState
+from perft import REFERENCE_POSITIONS, divide, perft
+
+
+@pytest.mark.parametrize("name", sorted(REFERENCE_POSITIONS))
+def test_reference_positions(name):
+    fen, counts = REFERENCE_POSITIONS[name]
+    board = BoardState.from_fen(fen)
+    for depth, expected in enumerate(counts[:3], start=1):
+        assert perft(board, depth) == expected
+
+
+def test_divide_sums_to_perft():
+    board = BoardState.from_fen(REFERENCE_POSITIONS["kiwipete"][0])
+    counts = divide(board, 2)
+    assert len(counts) == 48
+    assert counts["e1g1"] == 43
+    assert sum(counts.values()) == 2039
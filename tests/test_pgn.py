@@ -0,0 +1,61 @@
+import io
+
+import pytest
+from board import BoardState
+from perft import REFERENCE_POSITIONS
+from pgn import (
+    IllegalMoveError,
+    move_from_san,
+    move_to_san,
+    read_games,
+    replay,
+    validate_games,
+)
+
+ARCHIVE = """\
+[Event "Ruy Lopez"]
+[White "A"]
+[Black "B"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 {A comment that runs
+[onto a line starting with a bracket]} 4. Ba4 Nf6 5. O-O Be7 (5... b5 6. Bb3)
+6. Re1 b5 7. Bb3 d6 $1 8. c3 O-O 9. h3 Nb8 10. d4 Nbd7 1-0
+
+[Event "Illegal"]
+[Result "*"]
+
+1. e4 e5 2. Ke3 *
+"""
+
+
+def test_read_and_replay_games():
+    games = list(read_games(io.StringIO(ARCHIVE)))
+    assert [game.headers["Event"] for game in games] == ["Ruy Lopez", "Illegal"]
+    assert games[0].moves[:4] == ["e4", "e5", "Nf3", "Nc6"]
+    assert games[0].result == "1-0"
+    board = replay(games[0])
+    assert len(board.move_log) == 20
+    assert board.to_fen().startswith(
+        "r1bq1rk1/2pnbppp/p2p1n2/1p2p3/3PP3/1BP2N1P/PP3PP1/"
+    )
+    with pytest.raises(IllegalMoveError, match="2. Ke3"):
+        replay(games[1])
+    report = validate_games(read_games(io.StringIO(ARCHIVE)), workers=1)
+    assert (report.games, report.plies) == (2, 20)
+    assert report.errors == [(2, "2. Ke3 is not legal")]
+
+
+def test_san_round_trip():
+    board = BoardState.from_fen(REFERENCE_POSITIONS["kiwipete"][0])
+    sans = set()
+    for move in board.generate_legal_moves():
+        san = move_to_san(board, move)
+        assert move_from_san(board, san) == move
+        sans.add(san)
+    assert {"O-O", "O-O-O", "Qxf6", "Nxf7", "dxe6", "Bxa6"} <= sans
+    board = BoardState.from_fen("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+    assert move_to_san(board, move_from_san(board, "b8Q")) == "b8=Q+"
+    assert move_to_san(board, move_from_san(board, "b8=N")) == "b8=N"
+    with pytest.raises(IllegalMoveError):
+        move_from_san(board, "Nc3")
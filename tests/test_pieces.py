@@ -0,0 +1,28 @@
+from pieces.pieces import Knight, Queen, Pawn, KNIGHT_TARGETS, RAYS
+
+
+def test_move_tables():
+    assert set(KNIGHT_TARGETS[0]) == {(1, 2), (2, 1)}
+    assert RAYS[0][(1, 1)][:2] == ((1, 1), (2, 2))
+    assert Knight("w").potential_moves(57) == KNIGHT_TARGETS[57]
+
+
+def test_pawn_double_step_only_from_start_row():
+    assert Pawn("w").potential_moves(52)[:2] == ((5, 4), (4, 4))
+    assert Pawn("b").potential_moves(20) == ((3, 4), (3, 3), (3, 5))
+
+
+def test_sliders_stop_at_first_blocker():
+    board = [[None] * 8 for _ in range(8)]
+    board[3][5] = Pawn("b")
+    queen = Queen("w")
+    moves = queen.potential_moves(27, board)
+    assert (3, 5) in moves and (3, 6) not in moves
+    assert (3, 7) in queen.potential_moves(27)
+    assert next(queen.iter_potential_moves(27, board)) == moves[0]
+    assert list(queen.iter_potential_moves(27, board)) == moves
+
+
+def test_pieces_are_shared():
+    assert Pawn("w") is Pawn("w") and Pawn("w") is not Pawn("b")
+    assert not hasattr(Queen("b"), "__dict__")
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+import sprites
+from sprites import SpriteCache, SOURCE_DIR
+
+
+def test_cached_sprites_are_read_without_scaling(tmp_path):
+    cache = SpriteCache(cache_dir=str(tmp_path))
+    mtime = os.stat(os.path.join(SOURCE_DIR, "white-king.png")).st_mtime_ns
+    cached = tmp_path / f"white-king-64-{mtime}.png"
+    cached.write_bytes(b"scaled")
+    assert cache.path("white-king", 64) == str(cached)
+    assert cache.scaled == 0
+
+
+def test_sprites_are_scaled_once_per_size(tmp_path):
+    pytest.importorskip("PIL")
+    cache = SpriteCache(cache_dir=str(tmp_path))
+    path = cache.path("black-pawn", 32)
+    assert cache.path("black-pawn", 32) == path and cache.scaled == 1
+    cache.path("black-pawn", 48)
+    assert cache.scaled == 2 and len(os.listdir(tmp_path)) == 2
+
+
+def test_only_recent_sizes_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        sprites, "_scale", lambda source, target, size: open(target, "wb").close()
+    )
+    (tmp_path / "white-king-64-1.png").write_bytes(b"from an older source")
+    cache = SpriteCache(cache_dir=str(tmp_path))
+    for size in range(20, 30):
+        cache.path("white-king", size)
+    cache.path("white-queen", 20)
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == sprites.KEEP_SIZES + 1
+    assert "white-king-64-1.png" not in names
+    assert [name for name in names if name.startswith("white-queen-20-")]
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from board import BoardState
+from moves import move_to_uci
+from tablebase import (
+    DRAW,
+    Layout,
+    Tablebases,
+    dependencies,
+    generate,
+    parse_material,
+    plies_to_mate,
+    wdl,
+)
+
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("tables"))
+    generate("KQK", directory, workers=1)
+    tables = Tablebases(directory)
+    yield tables
+    tables.close()
+
+
+def test_layout_indexes_every_slot_once():
+    layout = Layout(parse_material("KBNK"))
+    assert layout.size == 2 * 10 * 64**3
+    for index in random.Random(0).sample(range(layout.size), 500):
+        assert layout.index(*layout.position(index)) == index
+    assert dependencies(parse_material("KPK")) == {
+        parse_material("KQK"),
+        parse_material("KRK"),
+    }
+
+
+def test_kqk_values(tables):
+    board = BoardState.from_fen("k7/8/1K6/8/8/8/8/2Q5 w - - 0 1")
+    assert tables.probe(board) == 1 and move_to_uci(tables.best_move(board)) == "c1c8"
+    board = BoardState.from_fen("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1")  # Stalemate
+    assert tables.probe(board) == DRAW
+    # The longest KQK mate takes ten moves
+    table = next(iter(tables.tables.values()))
+    assert max(table.value(index) for index in range(table.layout.size)) == 19
+    # Black's queen is found in the same table, by turning the board over
+    white = BoardState.from_fen("8/8/8/4k3/8/8/8/4KQ2 w - - 0 1")
+    black = BoardState.from_fen("4kq2/8/8/8/4K3/8/8/8 b - - 0 1")
+    assert tables.probe(white) == tables.probe(black) == 15
+    assert wdl(15) == 1 and plies_to_mate(15) == 15
+    assert tables.probe(BoardState()) is None
@@ -0,0 +1,75 @@
+import io
+import json
+import math
+
+import pytest
+from pgn import read_games, replay
+from tournament import (
+    Player,
+    elo_difference,
+    elo_error,
+    expected_score,
+    parse_player,
+    read_openings,
+    run_match,
+    sprt_bounds,
+    sprt_llr,
+)
+
+OPENINGS = """\
+# two first moves
+rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - id "e4";
+rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq - 0 1
+"""
+
+
+def test_parse_player():
+    assert parse_player("new:depth=3,hash=8") == Player("new", depth=3, hash_mb=8)
+    assert parse_player("fast:movetime=0.1").movetime == 0.1
+    with pytest.raises(ValueError):
+        parse_player("old")  # No limit
+    with pytest.raises(ValueError):
+        parse_player("old:depth=3,ponder=1")
+
+
+def test_statistics():
+    assert expected_score(0) == 0.5
+    assert elo_difference(0.5) == 0
+    assert elo_difference(expected_score(100)) == pytest.approx(100)
+    assert elo_difference(1.0) is None
+    assert elo_error(10, 20, 10) > elo_error(100, 200, 100) > 0
+    lower, upper = sprt_bounds(0.05, 0.05)
+    assert lower == pytest.approx(-math.log(19)) and upper == -lower
+    # A clear winner soon accepts H1, an even match leans towards H0
+    assert sprt_llr(600, 800, 400, 0, 5) > upper
+    assert sprt_llr(300, 400, 300, 0, 5) < 0
+    assert sprt_llr(0, 10, 0, 0, 5) == 0
+
+
+def test_run_match(tmp_path):
+    (tmp_path / "openings.epd").write_text(OPENINGS)
+    openings = read_openings(tmp_path / "openings.epd")
+    assert openings[0].endswith(" b KQkq - 0 1")
+    players = [Player("a", depth=1), Player("b", nodes=50)]
+    pgn_path, summary_path = tmp_path / "match.pgn", tmp_path / "match.json"
+    seen = []
+    summary = run_match(
+        players,
+        openings,
+        4,
+        pgn_path,
+        summary_path,
+        workers=1,
+        max_plies=20,
+        on_game=lambda record, tally: seen.append(record.number),
+    )
+    assert seen == [1, 2, 3, 4]
+    assert summary["games"] == summary["wins"] + summary["draws"] + summary["losses"]
+    written = json.loads(summary_path.read_text())
+    assert written["games"] == 4 and written["sprt"] == summary["sprt"]
+
+    games = list(read_games(io.StringIO(pgn_path.read_text())))
+    assert [game.headers["White"] for game in games] == ["a", "b", "a", "b"]
+    assert games[0].headers["FEN"] == games[1].headers["FEN"] == openings[0]
+    for game in games:
+        assert len(replay(game).move_log) == int(game.headers["PlyCount"]) <= 20
@@ -0,0 +1,40 @@
+import asyncio
+import io
+
+from engine import MATE_SCORE
+from uci import UCI, format_score, parse_go, time_budget
+
+
+def run_session(commands):
+    output = io.StringIO()
+    asyncio.run(UCI(output).run(io.StringIO(commands)))
+    return output.getvalue().splitlines()
+
+
+def test_go_arguments_and_clock():
+    limits = parse_go("wtime 60000 btime 30000 winc 1000 movestogo 20 ponder".split())
+    assert limits["wtime"] == 60000 and limits["movestogo"] == 20
+    assert limits["ponder"] and not limits["infinite"]
+    assert time_budget(60000, 1000, 20) == 3.75
+    assert time_budget(100, 1000) == 0.05  # Never more than the clock minus overhead
+    assert format_score(35) == "cp 35"
+    assert format_score(MATE_SCORE - 3) == "mate 2"
+    assert format_score(-MATE_SCORE + 2) == "mate -1"
+
+
+def test_session_answers_while_searching():
+    lines = run_session(
+        "uci\n"
+        "position fen r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR "
+        "w KQkq - 2 3\n"
+        "go infinite\n"
+        "isready\n"
+        "stop\n"
+        "position startpos moves e2e4 e7e5 g1f3\n"
+        "go depth 2\n"
+    )
+    assert "uciok" in lines
+    # readyok arrives before the infinite search is stopped with its bestmove
+    assert lines.index("readyok") < lines.index("bestmove f3f7")
+    assert lines[-1].startswith("bestmove ")
+    assert any(line.startswith("info depth 2 ") for line in lines[-3:])
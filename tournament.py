@@ -0,0 +1,419 @@
+"""
+Self-play matches between two engine configurations. Games start from an
+opening suite, run to the end under BoardState's rules and are played by a
+process pool, one game per task, so throughput grows with the number of
+workers. Every finished game is appended to a PGN file and the JSON summary
+(score, Elo difference with a 95% error bar, SPRT state) is rewritten, so a
+long match can be watched, or killed, at any point.
+
+Each opening is played twice with the colors swapped. The match ends after
+--games games or as soon as the SPRT accepts one of its hypotheses.
+
+    python tournament.py new:depth=4 old:depth=3 --openings suite.epd \\
+        --games 10000 --workers 32 --pgn match.pgn --summary match.json
+"""
+
+import argparse
+import collections
+import json
+import math
+import multiprocessing
+import os
+import time
+from typing import NamedTuple
+
+from board import BoardState
+from engine import Engine
+from pgn import Game, format_game, move_to_san
+
+MAX_PLIES = 400  # Games still going after this many plies are scored as draws
+ADJUDICATION = "max plies"
+Z_95 = 1.959964
+PLAYER_OPTIONS = {"depth": int, "nodes": int, "movetime": float, "hash": int}
+
+
+###############
+# PLAYERS
+###############
+
+
+class Player(NamedTuple):
+    name: str
+    depth: int = None
+    nodes: int = None
+    movetime: float = None  # Seconds per move
+    hash_mb: int = 16
+
+
+def parse_player(text):
+    """A Player from NAME:option=value,... with options depth, nodes, movetime, hash"""
+    name, _, options = text.partition(":")
+    if not name:
+        raise ValueError(f"player {text!r} has no name")
+    settings = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key not in PLAYER_OPTIONS:
+            raise ValueError(f"unknown player option {key!r}")
+        settings["hash_mb" if key == "hash" else key] = PLAYER_OPTIONS[key](value)
+    if not any(settings.get(key) for key in ("depth", "nodes", "movetime")):
+        raise ValueError(f"player {name!r} needs a depth, nodes or movetime limit")
+    return Player(name, **settings)
+
+
+def read_openings(path):
+    """
+    Start positions from a file of FEN or EPD lines. EPD operations after the
+    first four fields are dropped; blank lines and # comments are skipped.
+    """
+    openings = []
+    with open(path) as stream:
+        for line in stream:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                fen = " ".join(fields[:6])
+            else:
+                fen = " ".join(fields[:4]) + " 0 1"
+            BoardState.from_fen(fen)  # Raises ValueError for a bad line
+            openings.append(fen)
+    if not openings:
+        raise ValueError(f"no openings in {path}")
+    return openings
+
+
+###############
+# PLAYING
+###############
+
+
+class GameRecord(NamedTuple):
+    number: int  # Counting from 1 in the order the games were scheduled
+    white: str
+    black: str
+    fen: str
+    moves: list  # SAN
+    result: str
+    termination: str
+
+
+# One engine per player in each process, kept for the whole match
+_engines = {}
+
+
+def play_game(job):
+    """Play one game from (number, fen, white Player, black Player, max plies)"""
+    number, fen, white, black, max_plies = job
+    board = BoardState.from_fen(fen)
+    players = (white, black)
+    for player in players:
+        if player not in _engines:
+            _engines[player] = Engine(player.hash_mb)
+        _engines[player].new_game()
+
+    moves = []
+    outcome = board.outcome()
+    while outcome is None and len(moves) < max_plies:
+        player = players[0 if board.white_to_move else 1]
+        move = (
+            _engines[player]
+            .search(board, player.depth, player.nodes, player.movetime)
+            .best_move
+        )
+        moves.append(move_to_san(board, move))
+        board.make_move(move)
+        outcome = board.outcome()
+    if outcome is None:
+        result, termination = "1/2-1/2", ADJUDICATION
+    else:
+        result, termination = outcome.result, outcome.termination
+    return GameRecord(number, white.name, black.name, fen, moves, result, termination)
+
+
+def schedule(players, openings, games, max_plies=MAX_PLIES):
+    """The jobs for a match, each opening twice with the colors swapped"""
+    for index in range(games):
+        fen = openings[index // 2 % len(openings)]
+        white, black = players if index % 2 == 0 else players[::-1]
+        yield index + 1, fen, white, black, max_plies
+
+
+def game_to_pgn(record, event="Self-play match"):
+    headers = {
+        "Event": event,
+        "Round": str(record.number),
+        "White": record.white,
+        "Black": record.black,
+        "Result": record.result,
+    }
+    if record.fen != BoardState().to_fen():
+        headers["SetUp"] = "1"
+        headers["FEN"] = record.fen
+    headers["Termination"] = record.termination
+    headers["PlyCount"] = str(len(record.moves))
+    return format_game(Game(headers, record.moves, record.result))
+
+
+###############
+# STATISTICS
+###############
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score):
+    """Elo difference for a score between 0 and 1, None at either end"""
+    if not 0 < score < 1:
+        return None
+    return 400 * math.log10(score / (1 - score))
+
+
+def _score_and_variance(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    ) / games
+    return score, variance
+
+
+def elo_error(wins, draws, losses):
+    """Half the width of the 95% confidence interval of the Elo difference"""
+    games = wins + draws + losses
+    if not games:
+        return None
+    score, variance = _score_and_variance(wins, draws, losses)
+    margin = Z_95 * math.sqrt(variance / games)
+    low, high = elo_difference(score - margin), elo_difference(score + margin)
+    if low is None or high is None:
+        return None
+    return (high - low) / 2
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """
+    Log-likelihood ratio of H1 (the difference is elo1) against H0 (it is
+    elo0), in the usual normal approximation of the per-game scores.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    score, variance = _score_and_variance(wins, draws, losses)
+    if variance == 0:
+        return 0.0
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha, beta):
+    """LLR below the first bound accepts H0, above the second accepts H1"""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+class Tally:
+    """Running results of a match, from the first player's side"""
+
+    def __init__(self, players, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+        self.players = players
+        self.elo0, self.elo1 = elo0, elo1
+        self.bounds = sprt_bounds(alpha, beta)
+        self.wins = self.draws = self.losses = 0
+        self.terminations = collections.Counter()
+        self.started = time.perf_counter()
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, record):
+        self.terminations[record.termination] += 1
+        if record.result == "1/2-1/2":
+            self.draws += 1
+        elif (record.result == "1-0") == (record.white == self.players[0].name):
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    @property
+    def llr(self):
+        return sprt_llr(self.wins, self.draws, self.losses, self.elo0, self.elo1)
+
+    @property
+    def decision(self):
+        """H0 or H1 once the SPRT has accepted it, else None"""
+        llr = self.llr
+        if llr <= self.bounds[0]:
+            return "H0"
+        if llr >= self.bounds[1]:
+            return "H1"
+        return None
+
+    def summary(self):
+        games = self.games
+        score = (self.wins + self.draws / 2) / games if games else None
+        seconds = time.perf_counter() - self.started
+        return {
+            "players": [player._asdict() for player in self.players],
+            "games": games,
+            "wins": self.wins,
+            "draws": self.draws,
+            "losses": self.losses,
+            "score": score,
+            "elo": elo_difference(score) if games else None,
+            "elo_error": elo_error(self.wins, self.draws, self.losses),
+            "sprt": {
+                "elo0": self.elo0,
+                "elo1": self.elo1,
+                "llr": self.llr,
+                "bounds": list(self.bounds),
+                "decision": self.decision,
+            },
+            "terminations": dict(self.terminations),
+            "seconds": seconds,
+            "games_per_second": games / seconds if seconds else 0.0,
+        }
+
+
+###############
+# MATCH
+###############
+
+
+def _write_summary(path, summary):
+    # Written beside the target and renamed, so readers never see half a file
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as stream:
+        json.dump(summary, stream, indent=2)
+    os.replace(temporary, path)
+
+
+def run_match(
+    players,
+    openings,
+    games,
+    pgn_path,
+    summary_path,
+    workers=None,
+    max_plies=MAX_PLIES,
+    sprt=True,
+    on_game=None,
+    **tally_options,
+):
+    """
+    Play up to games games between two Players and return the final summary.
+    Results are streamed to pgn_path and summary_path as games finish, and
+    on_game, if given, is called with each GameRecord and the Tally. With
+    sprt the match stops as soon as a hypothesis is accepted; games still
+    being played are dropped.
+    """
+    workers = workers or os.cpu_count() or 1
+    tally = Tally(tuple(players), **tally_options)
+    jobs = schedule(tally.players, openings, games, max_plies)
+    if workers > 1:
+        pool = multiprocessing.get_context().Pool(workers)
+    else:
+        pool = _InProcess()
+    with open(pgn_path, "w") as pgn, pool:
+        for record in pool.imap_unordered(play_game, jobs, chunksize=1):
+            tally.add(record)
+            pgn.write(game_to_pgn(record) + "\n")
+            pgn.flush()
+            _write_summary(summary_path, tally.summary())
+            if on_game is not None:
+                on_game(record, tally)
+            if sprt and tally.decision is not None:
+                break  # Leaving the block terminates the pool
+    summary = tally.summary()
+    _write_summary(summary_path, summary)
+    return summary
+
+
+class _InProcess:
+    """Stands in for a pool with one worker, so games run in this process"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def imap_unordered(self, function, jobs, chunksize=1):
+        return map(function, jobs)
+
+
+###############
+# CLI
+###############
+
+
+def _format_elo(value, sign="+"):
+    return "inf" if value is None else f"{value:{sign}.1f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a self-play match")
+    parser.add_argument("players", nargs=2, help="NAME:depth=4,nodes=...,hash=16")
+    parser.add_argument("--openings", help="FEN or EPD file (default: start only)")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    parser.add_argument("--pgn", default="match.pgn")
+    parser.add_argument("--summary", default="match.json")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=5.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument(
+        "--no-sprt", action="store_true", help="play every game, whatever the LLR"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        players = [parse_player(text) for text in args.players]
+        if players[0].name == players[1].name:
+            raise ValueError("the players need different names")
+        openings = (
+            read_openings(args.openings) if args.openings else [BoardState().to_fen()]
+        )
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    def progress(record, tally):
+        summary = tally.summary()
+        print(
+            f"game {tally.games:>5} (#{record.number})  "
+            f"+{tally.wins} ={tally.draws} -{tally.losses}  "
+            f"elo {_format_elo(summary['elo'])} "
+            f"+/- {_format_elo(summary['elo_error'], '')}  "
+            f"llr {summary['sprt']['llr']:.2f} "
+            f"[{tally.bounds[0]:.2f}, {tally.bounds[1]:.2f}]",
+            flush=True,
+        )
+
+    summary = run_match(
+        players,
+        openings,
+        args.games,
+        args.pgn,
+        args.summary,
+        workers=args.workers,
+        max_plies=args.max_plies,
+        sprt=not args.no_sprt,
+        on_game=progress,
+        elo0=args.elo0,
+        elo1=args.elo1,
+        alpha=args.alpha,
+        beta=args.beta,
+    )
+    print(
+        f"{summary['games']} games  {summary['seconds']:.1f}s  "
+        f"{summary['games_per_second']:.2f} games/sec  "
+        f"sprt {summary['sprt']['decision'] or 'undecided'}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Universal Chess Interface front end, so the engine can be run by chess GUIs,
+tournament managers and test harnesses.
+
+Commands are read from stdin by an asyncio task while the search runs on a
+worker thread, so stop, isready and ponderhit are answered mid-search.
+
+    python -m uci
+    echo "position startpos moves e2e4
+    go depth 5" | python -m uci
+"""
+
+import asyncio
+import sys
+import threading
+import time
+
+from board import BoardState
+from book import OpeningBook
+from engine import Engine, MATE_SCORE, MATE_BOUND
+from moves import move_from_uci, move_to_uci
+from parallel import ParallelEngine
+from tablebase import Tablebases
+
+ENGINE_NAME = "chess"
+MOVE_OVERHEAD_MS = 50  # Kept back from every move for the GUI's own overhead
+DEFAULT_MOVES_TO_GO = 30  # Moves the remaining clock is shared between
+STOP_POLL_SECONDS = 0.05
+
+GO_LIMITS = (
+    "wtime", "btime", "winc", "binc", "movestogo", "depth", "nodes", "movetime",
+    "mate",
+)  # fmt: skip
+
+
+def time_budget(time_left, increment=0, moves_to_go=None):
+    """Seconds to spend on one move from a clock given in milliseconds"""
+    budget = time_left / (moves_to_go or DEFAULT_MOVES_TO_GO) + increment * 3 / 4
+    budget = min(budget, time_left - MOVE_OVERHEAD_MS)
+    return max(budget, 1) / 1000
+
+
+def parse_go(args):
+    """go arguments as a dict of the numeric limits plus ponder and infinite"""
+    limits = {"ponder": False, "infinite": False}
+    tokens = iter(args)
+    for token in tokens:
+        if token in ("ponder", "infinite"):
+            limits[token] = True
+        elif token in GO_LIMITS:
+            limits[token] = int(next(tokens, "0"))
+        elif token == "searchmoves":
+            break  # Not supported; the moves run to the end of the line
+    return limits
+
+
+def format_score(score):
+    if abs(score) > MATE_BOUND:
+        plies = MATE_SCORE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+    return f"cp {score}"
+
+
+class UCI:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self._output_lock = threading.Lock()  # info lines come from the search thread
+        self.hash_mb = 16
+        self.threads = 1
+        self.engine = None
+        self.book = None  # Its moves are played without searching
+        self.tablebases = None  # And so are these, once few pieces are left
+        self.board = BoardState()
+        self._search_task = None
+        self._release = asyncio.Event()  # Lets a ponder or infinite search report
+        self._ponder_budget = None  # Seconds to use once ponderhit arrives
+        self._timer = None
+
+    def send(self, line):
+        with self._output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def _make_engine(self):
+        if self.engine is not None:
+            return
+        if self.threads > 1:
+            self.engine = ParallelEngine(self.threads, self.hash_mb)
+        else:
+            self.engine = Engine(self.hash_mb)
+
+    def _close_engine(self):
+        if isinstance(self.engine, ParallelEngine):
+            self.engine.close()
+        self.engine = None
+
+    ###############
+    # INPUT
+    ###############
+
+    async def run(self, stream=sys.stdin):
+        """
+        Answer commands from stream until quit or end of input. At the end of
+        input a search with limits is allowed to finish; an infinite or
+        ponder search is stopped.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await loop.run_in_executor(None, stream.readline)
+                if not line:
+                    if self._search_task is not None:
+                        if self._release.is_set():
+                            await self._search_task
+                        else:
+                            await self.stop()
+                    break
+                if not await self.handle(line):
+                    break
+        finally:
+            await self.stop()
+            self._close_engine()
+            if self.book is not None:
+                self.book.close()
+            if self.tablebases is not None:
+                self.tablebases.close()
+
+    async def handle(self, line):
+        """Carry out one command; False once the engine should exit"""
+        command, *args = line.split() or [""]
+        if command == "quit":
+            return False
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send("id author alexclippinger and contributors")
+            self.send("option name Hash type spin default 16 min 1 max 1024")
+            self.send("option name Threads type spin default 1 min 1 max 64")
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            await self.stop()
+            self._set_option(args)
+        elif command == "ucinewgame":
+            await self.stop()
+            if self.engine is not None:
+                self.engine.new_game()
+            self.board = BoardState()
+        elif command == "position":
+            await self.stop()
+            self._set_position(args)
+        elif command == "go":
+            await self.stop()
+            limits = parse_go(args)
+            if limits["ponder"] or limits["infinite"] or not self._play_known_move():
+                self._go(limits)
+        elif command == "stop":
+            await self.stop()
+        elif command == "ponderhit":
+            self._ponderhit()
+        elif command:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def _set_option(self, args):
+        text = " ".join(args)
+        name, _, value = text.partition(" value ")
+        name = name.removeprefix("name ").strip().lower()
+        if name == "hash":
+            self.hash_mb = max(1, int(value))
+            self._close_engine()
+        elif name == "threads":
+            self.threads = max(1, int(value))
+            self._close_engine()
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+                self.book = None
+            if value and value != "<empty>":
+                try:
+                    self.book = OpeningBook(value.strip())
+                except (OSError, ValueError) as error:
+                    self.send(f"info string no book: {error}")
+        elif name == "tablebasepath":
+            if self.tablebases is not None:
+                self.tablebases.close()
+                self.tablebases = None
+            if value and value != "<empty>":
+                try:
+                    self.tablebases = Tablebases(value.strip())
+                except (OSError, ValueError) as error:
+                    self.send(f"info string no tablebases: {error}")
+
+    def _set_position(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1 :]
+        else:
+            moves = []
+        try:
+            if args[:1] == ["fen"]:
+                board = BoardState.from_fen(" ".join(args[1:]))
+            else:
+                board = BoardState()
+        except ValueError as error:
+            self.send(f"info string {error}")
+            return
+        for text in moves:
+            try:
+                move = move_from_uci(text)
+            except (ValueError, IndexError):
+                move = None
+            if move not in board.legal_moves():
+                self.send(f"info string illegal move {text}")
+                break
+            board.make_move(move)
+        self.board = board
+
+    ###############
+    # SEARCH
+    ###############
+
+    def _play_known_move(self):
+        """Answer go from the book or the tablebases if either has the position"""
+        move = self.book.choose(self.board) if self.book is not None else None
+        source = "book"
+        if move is None and self.tablebases is not None:
+            move, source = self.tablebases.best_move(self.board), "tablebase"
+        if move is None:
+            return False
+        self.send(f"info string {source} move")
+        self.send(f"bestmove {move_to_uci(move)}")
+        return True
+
+    def _go(self, limits):
+        self._make_engine()
+        own = "wtime" if self.board.white_to_move else "btime"
+        increment = "winc" if self.board.white_to_move else "binc"
+        budget = None
+        if own in limits:
+            budget = time_budget(
+                limits[own], limits.get(increment, 0), limits.get("movestogo")
+            )
+        movetime = limits.get("movetime")
+        movetime = movetime / 1000 if movetime is not None else budget
+        depth = limits.get("depth")
+        if "mate" in limits:
+            depth = 2 * limits["mate"] - 1
+
+        self._release.clear()
+        self._ponder_budget = None
+        if limits["ponder"]:
+            self._ponder_budget, movetime = movetime, None
+        elif limits["infinite"]:
+            movetime = None
+        else:
+            self._release.set()
+        self._search_task = asyncio.ensure_future(
+            self._search(depth, limits.get("nodes"), movetime)
+        )
+
+    async def _search(self, depth, nodes, movetime):
+        started = time.perf_counter()
+
+        def info(result):
+            elapsed = time.perf_counter() - started
+            self.send(
+                f"info depth {result.depth} score {format_score(result.score)} "
+                f"nodes {result.nodes} nps {int(result.nodes / max(elapsed, 1e-6))} "
+                f"time {int(elapsed * 1000)} hashfull {self.engine.tt.hashfull()} "
+                f"pv {' '.join(map(move_to_uci, result.pv))}"
+            )
+
+        result = await asyncio.to_thread(
+            self.engine.search, self.board, depth, nodes, movetime, info
+        )
+        # While pondering or analysing, the move is only given once asked for
+        await self._release.wait()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if result.best_move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            ponder = move_to_uci(result.pv[1])
+            self.send(f"bestmove {move_to_uci(result.best_move)} ponder {ponder}")
+        else:
+            self.send(f"bestmove {move_to_uci(result.best_move)}")
+
+    def _ponderhit(self):
+        """The predicted move was played: carry on searching, now on the clock"""
+        if self._search_task is None or self._release.is_set():
+            return
+        self._release.set()
+        if self._ponder_budget is not None and not self._search_task.done():
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self._ponder_budget, self.engine.stop)
+
+    async def stop(self):
+        """End the running search, if any, once its bestmove has been sent"""
+        task, self._search_task = self._search_task, None
+        if task is None:
+            return
+        self._release.set()
+        # The search may not have started yet, so keep asking until it ends
+        while not task.done():
+            self.engine.stop()
+            await asyncio.wait([task], timeout=STOP_POLL_SECONDS)
+        await task
+
+
+def main():
+    asyncio.run(UCI().run(sys.stdin))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Zobrist keys for hashing positions.
+
+A position's key is the XOR of one random 64-bit number per (color, piece
+type, square) occupied, plus numbers for the castling rights, the en passant
+file and black to move. The generator is seeded so keys are identical in
+every process.
+"""
+
+import random
+
+_random = random.Random(0x5A0B1257)
+
+# PIECE_KEYS[color][piece_type][square]
+PIECE_KEYS = [
+    [[_random.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)
+]
+# One key per castling right bit, combined for every 4-bit rights mask
+_CASTLING_RIGHT_KEYS = [_random.getrandbits(64) for _ in range(4)]
+CASTLING_KEYS = [0] * 16
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights >> _bit & 1:
+            CASTLING_KEYS[_rights] ^= _CASTLING_RIGHT_KEYS[_bit]
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]  # by file
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)